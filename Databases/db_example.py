@@ -1,52 +1,42 @@
-import sqlite3
-
-# Step 1: Connect to a database (or create one if it doesn't exist)
-conn = sqlite3.connect('example.db')
-
-# Step 2: Create a cursor object to execute SQL commands
-cursor = conn.cursor()
-
-# Step 3: Create a table
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS users(
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    name TEXT NOT NULL,
-    age INTEGER,
-    email TEXT UNIQUE      
-)
-''')
-
-# Step 4: Insert data into the table
-cursor.execute("INSERT INTO users (name, age, email) VALUES ('Steve', 28, 'steve@gmail.com')")
-cursor.execute("INSERT INTO users (name, age, email) VALUES ('Joe', 25, 'joe@gmail.com')")
-cursor.execute("INSERT INTO users (name, age, email) VALUES ('Bob', 25, 'bob@gmail.com')")
-
-# Step 5: Commit the changes
-conn.commit()
-
-# Step 6: Query the database
-cursor.execute("SELECT * FROM users")
-rows = cursor.fetchall()
-
-# Display the results
+from users_db import connect, delete_users, iter_users, set_age, upsert_users
+
+# Step 1: Connect to a database (or create one if it doesn't exist).
+# connect() also creates the users table:
+#
+# CREATE TABLE IF NOT EXISTS users(
+#     id INTEGER PRIMARY KEY AUTOINCREMENT,
+#     name TEXT NOT NULL,
+#     age INTEGER,
+#     email TEXT UNIQUE
+# )
+conn = connect('example.db')
+
+# Steps 2-5: Insert the users in one transaction (one commit for all rows).
+# The values are passed as parameters instead of being written into the SQL,
+# and running the script again updates the users instead of failing on the
+# UNIQUE email.
+upsert_users(conn, [
+    ('Steve', 28, 'steve@gmail.com'),
+    ('Joe', 25, 'joe@gmail.com'),
+    ('Bob', 25, 'bob@gmail.com'),
+])
+
+# Step 6: Query the database. iter_users() reads the table a page of rows at
+# a time instead of all of it at once (fetchall), so this works the same for
+# a table of any size; record=None gives plain tuples.
 print("Users in the database:")
-for row in rows:
+for row in iter_users(conn, record=None):
     print(row)
 
-# Step 7: Update a record
-cursor.execute("UPDATE users SET age = 31 WHERE name = 'Steve'")
-conn.commit()
+# Step 7: Update a record (each statement commits by itself)
+set_age(conn, 'Steve', 31)
 
 # Step 8: Delete a record
-cursor.execute("DELETE FROM users WHERE name = 'Bob'")
-conn.commit()
+delete_users(conn, 'Bob')
 
 # Step 9: Query the database again
-cursor.execute("SELECT * FROM users")
-rows = cursor.fetchall()
-
 print("\nUsers after updates and deletions:")
-for row in rows:
+for row in iter_users(conn, record=None):
     print(row)
 
 # Step 10: Close the connection
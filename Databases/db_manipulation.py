@@ -1,13 +1,12 @@
-import mysql.connector
-
-# Connect to MySQL
-conn = mysql.connector.connect(
-    host="localhost",
-    user="admin",  # Default XAMPP user
-    password="yourpassword",  # No password by default
-    database="world"  # Change to your database name
-)
-cursor = conn.cursor()
+import world_db
+
+# Connections come from the shared pool in world_db.py; the host, user,
+# password and database are set in world_db.ini or WORLD_DB_* environment
+# variables (see world_db.ini.example). The examples below that use a cursor
+# run inside:
+#
+# with world_db.connection() as conn:
+#     cursor = conn.cursor()
 
 # cursor.execute("SHOW DATABASES")
 # cursor.execute(cursor.execute("SELECT SUM(SurfaceArea) AS 'N. America Surface Area', SUM(Population) AS 'N. America Population' FROM world.country WHERE Region = 'North America'")
@@ -107,13 +106,13 @@ cursor = conn.cursor()
 #--------------------------------------------------------------------
 
 #--------------------------9. NULL Values--------------------------------
-cursor.execute(
+rows = world_db.query(
 "SELECT name, lifeexpectancy FROM country WHERE lifeexpectancy IS NULL;"
 )
 
 print("Cities with NULL life expectancy")
 
-for city, lifeExpect in cursor:
+for city, lifeExpect in rows:
     print(city)
 #--------------------------------------------------------------------
 
@@ -1,13 +1,15 @@
-import mysql.connector
+import os
+import sys
 
-# Connect to MySQL
-conn = mysql.connector.connect(
-    host="localhost",
-    user="root",  # Default XAMPP user
-    password="",  # No password by default
-    database="world"  # Change to your database name
-)
-cursor = conn.cursor()
+# world_db.py (the shared connection pool) is in the parent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import world_db
+
+# The connection settings are in world_db.ini or WORLD_DB_* environment
+# variables (see world_db.ini.example). Examples that use a cursor run inside:
+#
+# with world_db.connection() as conn:
+#     cursor = conn.cursor()
 
 # To show the existing databases
 #------------------------------------------------------------------------
@@ -29,17 +31,11 @@ cursor = conn.cursor()
 
 # The following query demonstrates how to use aggregate functions SUM(), MIN(), MAX(), and AVG() to summarize data. Because the query does not include a WHERE condition, the functions aggregate data from all records in the country table.
 #------------------------------------------------------------------------
-cursor.execute(
+total, average, maximum, minimum, count = world_db.query(
     "SELECT sum(Population), avg(Population), max(Population), min(Population), count(Population) FROM world.country;"
-)
-result = cursor.fetchone()
-for sum,average,max,min in cursor:
-    sum = float(result[0])
-    average = float(result[1])
-    max = float(result[2])
-    min = float(result[3])
-
-    print(f"Total population: {sum}")
-    print(f"Average population: {average}")
-    print(f"Maximum population: {max}")
-    print(f"Minimum population: {min}")
\ No newline at end of file
+)[0]
+
+print(f"Total population: {float(total)}")
+print(f"Average population: {float(average)}")
+print(f"Maximum population: {float(maximum)}")
+print(f"Minimum population: {float(minimum)}")
\ No newline at end of file
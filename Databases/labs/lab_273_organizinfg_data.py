@@ -1,13 +1,15 @@
-import mysql.connector
+import os
+import sys
 
-# Connect to MySQL
-conn = mysql.connector.connect(
-    host="localhost",
-    user="admin",  # Default XAMPP user
-    password="yourpassword",  # No password by default
-    database="world"  # Change to your database name
-)
-cursor = conn.cursor()
+# world_db.py (the shared connection pool) is in the parent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import world_db
+
+# The connection settings are in world_db.ini or WORLD_DB_* environment
+# variables (see world_db.ini.example). Examples that use a cursor run inside:
+#
+# with world_db.connection() as conn:
+#     cursor = conn.cursor()
 
 # cursor.execute("SHOW DATABASES;")
 # for i in cursor:
@@ -18,7 +20,7 @@ cursor = conn.cursor()
 # for i in cursor:
 #     print(i)
 
-cursor.execute("SELECT Region, Name, Population, SUM(Population) OVER(partition by Region ORDER BY Population) as 'Running Total' FROM world.country WHERE Region = 'Australia and New Zealand';")
+rows = world_db.query("SELECT Region, Name, Population, SUM(Population) OVER(partition by Region ORDER BY Population) as 'Running Total' FROM world.country WHERE Region = %s;", ("Australia and New Zealand",))
 
-for i in cursor:
+for i in rows:
     print(i)
\ No newline at end of file
@@ -0,0 +1,379 @@
+import argparse
+import contextlib
+import itertools
+import os
+import sqlite3
+import sys
+import time
+
+# Data access for the users table of example.db (see db_example.py).
+#
+# Every statement takes its values as ? parameters, so SQLite compiles each
+# statement once and caches it, and names with quotes in them cannot break the
+# SQL. Writing many rows is fast when they share one transaction: SQLite syncs
+# the database file once per commit, so upsert_users() sends the rows with
+# executemany() and only commits every batch_size rows.
+
+DATABASE = "example.db"
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS users(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    age INTEGER,
+    email TEXT UNIQUE
+)
+'''
+
+# a row with an email that is already in the table updates that user
+UPSERT_SQL = '''
+INSERT INTO users (name, age, email) VALUES (?, ?, ?)
+ON CONFLICT(email) DO UPDATE SET name = excluded.name, age = excluded.age
+'''
+
+# Schema changes after SCHEMA, in order. The database's version (PRAGMA
+# user_version) is the number of them it has; migrate() applies the rest.
+# Only append to this list: a database that already has a migration never
+# runs it again.
+MIGRATIONS = (
+    # 1: set_age() and delete_users() look users up by name
+    "CREATE INDEX IF NOT EXISTS users_name ON users(name)",
+    # 2: users_aged() filters by age
+    "CREATE INDEX IF NOT EXISTS users_age ON users(age)",
+)
+
+JOURNAL_MODES = ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF")
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+
+def connect(path=DATABASE, journal_mode="WAL", synchronous="NORMAL"):
+    """Open the database, create or migrate the users table if needed and set the journal pragmas.
+
+    The connection is in autocommit mode: a single statement commits by
+    itself, and several statements are grouped with transaction(). In WAL
+    mode, synchronous=NORMAL only syncs at checkpoints, which is still safe
+    against corruption but may lose the last commits on a power failure; use
+    FULL if every commit must survive one.
+    """
+    journal_mode, synchronous = journal_mode.upper(), synchronous.upper()
+    # pragma values cannot be ? parameters, so they are checked instead
+    if journal_mode not in JOURNAL_MODES:
+        raise ValueError(f"journal_mode must be one of {', '.join(JOURNAL_MODES)}")
+    if synchronous not in SYNCHRONOUS_MODES:
+        raise ValueError(f"synchronous must be one of {', '.join(SYNCHRONOUS_MODES)}")
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+        conn.execute(f"PRAGMA synchronous = {synchronous}")
+        conn.execute(SCHEMA)
+        migrate(conn)
+    except sqlite3.Error:
+        conn.close()
+        raise
+    return conn
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Apply the MIGRATIONS the database does not have yet and return its (old, new) version.
+
+    Each migration is committed together with the new version number, so an
+    interrupted migration is simply run again next time.
+    """
+    oldVersion = schema_version(conn)
+    if oldVersion > len(MIGRATIONS):
+        raise sqlite3.DatabaseError(f"the database has schema version {oldVersion}, "
+                                    f"newer than this program's {len(MIGRATIONS)}")
+    for version in range(oldVersion + 1, len(MIGRATIONS) + 1):
+        with transaction(conn):
+            # another connection may have migrated since the version was read
+            if schema_version(conn) < version:
+                conn.execute(MIGRATIONS[version - 1])
+                conn.execute(f"PRAGMA user_version = {version}")
+    return oldVersion, schema_version(conn)
+
+
+@contextlib.contextmanager
+def transaction(conn):
+    """Run the statements of a with block as one transaction: all of them are committed or none.
+
+    BEGIN IMMEDIATE takes the write lock at the start, so a transaction that
+    reads before it writes cannot fail halfway because another connection
+    wrote in the meantime.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def upsert_users(conn, rows, batch_size=10000):
+    """Insert or update (name, age, email) rows and return how many were written.
+
+    rows can be any iterable, e.g. a generator over a file; only batch_size
+    rows are held in memory. Each batch is committed on its own, so if a row
+    fails the earlier batches stay written. With batch_size=None all rows are
+    one transaction.
+    """
+    rows = iter(rows)
+    count = 0
+    while batch := list(itertools.islice(rows, batch_size)):
+        with transaction(conn):
+            conn.executemany(UPSERT_SQL, batch)
+        count += len(batch)
+    return count
+
+
+def add_user(conn, name, age, email):
+    """Insert one user and return its id."""
+    return conn.execute("INSERT INTO users (name, age, email) VALUES (?, ?, ?)", (name, age, email)).lastrowid
+
+
+def set_age(conn, name, age):
+    """Set the age of every user with this name and return how many were changed."""
+    return conn.execute("UPDATE users SET age = ? WHERE name = ?", (age, name)).rowcount
+
+
+def delete_users(conn, name):
+    """Delete every user with this name and return how many were deleted."""
+    return conn.execute("DELETE FROM users WHERE name = ?", (name,)).rowcount
+
+
+def count_users(conn):
+    return conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+
+class User:
+    """One row of the users table. __slots__ keeps it as small as a tuple while having named fields."""
+
+    __slots__ = ("id", "name", "age", "email")
+
+    def __init__(self, id, name, age, email):
+        self.id = id
+        self.name = name
+        self.age = age
+        self.email = email
+
+    def __eq__(self, other):
+        if not isinstance(other, User):
+            return NotImplemented
+        return (self.id, self.name, self.age, self.email) == (other.id, other.name, other.age, other.email)
+
+    def __repr__(self):
+        return f"User(id={self.id!r}, name={self.name!r}, age={self.age!r}, email={self.email!r})"
+
+
+def iter_users(conn, page_size=1000, after_id=0, record=User):
+    """Yield the users in id order, reading page_size rows at a time.
+
+    Each page is its own query (WHERE id > last id seen, which is a seek on
+    the primary key), so memory does not grow with the table, no read
+    transaction stays open between pages, and stopping early (break, or
+    closing the generator) leaves nothing behind. Pass the last id seen as
+    after_id to continue later. record builds each item from the row's
+    columns; None yields plain tuples.
+    """
+    while True:
+        rows = conn.execute("SELECT id, name, age, email FROM users WHERE id > ? ORDER BY id LIMIT ?",
+                            (after_id, page_size)).fetchall()
+        if not rows:
+            return
+        after_id = rows[-1][0]
+        if record is None:
+            yield from rows
+        else:
+            yield from itertools.starmap(record, rows)
+        if len(rows) < page_size:
+            return
+
+
+def iter_rows(conn, sql, parameters=(), batch_size=1000):
+    """Yield the rows of any query, fetching batch_size at a time with fetchmany().
+
+    Unlike iter_users() the query stays open until the last row is read (one
+    read transaction for the whole result), so close the generator when
+    stopping early; the cursor is closed then.
+    """
+    cursor = conn.execute(sql, parameters)
+    try:
+        while rows := cursor.fetchmany(batch_size):
+            yield from rows
+    finally:
+        cursor.close()
+
+
+def get_user(conn, id):
+    """The user with this id, or None."""
+    row = conn.execute("SELECT id, name, age, email FROM users WHERE id = ?", (id,)).fetchone()
+    return User(*row) if row is not None else None
+
+
+def users_aged(conn, low, high, batch_size=1000):
+    """Yield the users with low <= age <= high, youngest first."""
+    rows = iter_rows(conn, "SELECT id, name, age, email FROM users WHERE age BETWEEN ? AND ? ORDER BY age",
+                     (low, high), batch_size)
+    return itertools.starmap(User, rows)
+
+
+# the queries this module runs, for explain(): (what, sql, sample parameters,
+# whether reading the whole table is expected)
+APP_QUERIES = (
+    ("get_user", "SELECT id, name, age, email FROM users WHERE id = ?", (1,), False),
+    ("set_age", "UPDATE users SET age = ? WHERE name = ?", (31, "Steve"), False),
+    ("delete_users", "DELETE FROM users WHERE name = ?", ("Bob",), False),
+    ("iter_users", "SELECT id, name, age, email FROM users WHERE id > ? ORDER BY id LIMIT ?", (0, 1000), False),
+    ("users_aged", "SELECT id, name, age, email FROM users WHERE age BETWEEN ? AND ? ORDER BY age", (20, 30), False),
+    ("upsert_users", UPSERT_SQL, ("Steve", 28, "steve@gmail.com"), False),
+    ("count_users", "SELECT COUNT(*) FROM users", (), True),
+)
+
+
+def query_plan(conn, sql, parameters=()):
+    """The lines of SQLite's EXPLAIN QUERY PLAN for a statement (which is not run)."""
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, parameters)]
+
+
+def explain(conn, queries=APP_QUERIES):
+    """Print the plan of every query, flag the ones that read the whole table and return how many did unexpectedly.
+
+    "SCAN" in a plan means SQLite reads every row of a table (or index),
+    which is O(N); "SEARCH" means it looks the rows up in an index.
+    """
+    unexpected = 0
+    for label, sql, parameters, scanExpected in queries:
+        plan = query_plan(conn, sql, parameters)
+        scans = [line for line in plan if line.startswith("SCAN")]
+        if not scans:
+            verdict = "ok"
+        elif scanExpected:
+            verdict = "full scan (expected)"
+        else:
+            verdict = "FULL SCAN"
+            unexpected += 1
+        print(f"{label}: {verdict}")
+        for line in plan:
+            print(f"    {line}")
+    return unexpected
+
+
+def benchmark_rows(count, start=0):
+    for number in range(start, start + count):
+        yield f"user{number}", 18 + number % 60, f"user{number}@example.com"
+
+
+def remove_database(path):
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path + suffix)
+
+
+def print_rate(label, rows, rate):
+    print(f"{label:<30}{rows:>10} rows{rate:>12,.0f} rows/sec")
+
+
+def benchmark(path, rows, batch_size, journal_mode, synchronous, naive_rows):
+    """Print the rows/sec of committing every row (like db_example.py) and of upsert_users()."""
+    remove_database(path)
+    try:
+        # one execute and one commit per row, with SQLite's default journal
+        conn = connect(path, journal_mode="DELETE", synchronous="FULL")
+        startTime = time.perf_counter()
+        for row in benchmark_rows(naive_rows):
+            conn.execute(UPSERT_SQL, row)
+        naiveRate = naive_rows / max(time.perf_counter() - startTime, 1e-9)
+        conn.close()
+        remove_database(path)
+        print_rate("one commit per row", naive_rows, naiveRate)
+
+        conn = connect(path, journal_mode, synchronous)
+        startTime = time.perf_counter()
+        written = upsert_users(conn, benchmark_rows(rows), batch_size)
+        bulkRate = written / max(time.perf_counter() - startTime, 1e-9)
+        print_rate(f"upsert_users, batch {batch_size}", written, bulkRate)
+
+        # the same rows again: every one is now an update
+        startTime = time.perf_counter()
+        written = upsert_users(conn, benchmark_rows(rows), batch_size)
+        updateRate = written / max(time.perf_counter() - startTime, 1e-9)
+        print_rate("upsert_users, all updates", written, updateRate)
+        conn.close()
+        print(f"{bulkRate / naiveRate:.0f}x faster than one commit per row")
+    finally:
+        remove_database(path)
+
+
+def scan(path, page_size):
+    """Read every user with iter_users() and print how fast that was."""
+    conn = connect(path)
+    count = ageTotal = 0
+    startTime = time.perf_counter()
+    for user in iter_users(conn, page_size):
+        count += 1
+        ageTotal += user.age or 0
+    elapsed = max(time.perf_counter() - startTime, 1e-9)
+    conn.close()
+    print(f"{count} users, average age {ageTotal / max(count, 1):.1f}")
+    print_rate(f"iter_users, page {page_size}", count, count / elapsed)
+
+
+def run_migrate(path):
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        conn.execute(SCHEMA)
+        oldVersion, newVersion = migrate(conn)
+    finally:
+        conn.close()
+    if oldVersion == newVersion:
+        print(f"Schema version {newVersion}, nothing to do")
+    else:
+        print(f"Migrated the schema from version {oldVersion} to {newVersion}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Users table of example.db.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    benchmarkParser = commands.add_parser("benchmark", help="measure how many rows/sec can be written")
+    benchmarkParser.add_argument("--database", default="users_benchmark.db",
+                                 help="scratch database file, deleted afterwards (default: users_benchmark.db)")
+    benchmarkParser.add_argument("--rows", type=int, default=1000000, help="rows to upsert (default: 1000000)")
+    benchmarkParser.add_argument("--batch-size", type=int, default=10000, help="rows per commit (default: 10000)")
+    benchmarkParser.add_argument("--journal-mode", choices=JOURNAL_MODES, default="WAL", type=str.upper)
+    benchmarkParser.add_argument("--synchronous", choices=SYNCHRONOUS_MODES, default="NORMAL", type=str.upper)
+    benchmarkParser.add_argument("--naive-rows", type=int, default=2000,
+                                 help="rows to write one commit at a time for comparison (default: 2000)")
+    scanParser = commands.add_parser("scan", help="read every user page by page and measure rows/sec")
+    scanParser.add_argument("--database", default=DATABASE, help=f"database file (default: {DATABASE})")
+    scanParser.add_argument("--page-size", type=int, default=1000, help="rows per query (default: 1000)")
+    migrateParser = commands.add_parser("migrate", help="bring the schema (indexes) up to date")
+    migrateParser.add_argument("--database", default=DATABASE, help=f"database file (default: {DATABASE})")
+    explainParser = commands.add_parser("explain", help="print the query plans and flag full table scans")
+    explainParser.add_argument("--database", default=DATABASE, help=f"database file (default: {DATABASE})")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        run_migrate(args.database)
+    elif args.command == "explain":
+        # the plans of the database as it is: not migrated first
+        conn = sqlite3.connect(args.database, isolation_level=None)
+        try:
+            conn.execute(SCHEMA)
+            unexpected = explain(conn)
+        finally:
+            conn.close()
+        if unexpected:
+            print(f"{unexpected} queries read the whole table, run: python users_db.py migrate")
+            sys.exit(1)
+    elif args.command == "scan":
+        scan(args.database, args.page_size)
+    elif args.command == "benchmark":
+        benchmark(args.database, args.rows, args.batch_size, args.journal_mode, args.synchronous, args.naive_rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+import argparse
+import concurrent.futures
+import queue
+import random
+import sqlite3
+import threading
+import time
+import weakref
+
+import users_db
+
+# Thread-safe access to example.db for programs with many threads.
+#
+# The database is in WAL mode, where readers never wait for the writer and
+# the writer never waits for readers, but there can only be one writer at a
+# time. So every thread reads through its own connection, and all writes go
+# to a single writer thread through a queue. The writer takes every job that
+# is waiting (up to max_batch) and runs them in one transaction, so many
+# small writes share one commit, and no two connections ever compete for the
+# write lock ("database is locked").
+
+
+class UsersPool:
+    """Per-thread read connections and one writer thread for a users database.
+
+        with UsersPool("example.db") as pool:
+            user = pool.read(users_db.get_user, 1)
+            pool.submit(users_db.set_age, "Steve", 31).result()
+    """
+
+    def __init__(self, path=users_db.DATABASE, synchronous="NORMAL", max_batch=1000, timeout=30.0):
+        """max_batch: most write jobs committed together; timeout: seconds to wait for a lock."""
+        self.path = path
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.local = threading.local()
+        self.readers = weakref.WeakSet()  # the open _Readers, so close() can close them
+        self.readers_lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.closed = False
+        self.closed_lock = threading.Lock()  # nothing is queued after close() queued the final None
+        started = concurrent.futures.Future()
+        self.writer = threading.Thread(target=self._write_loop, args=(synchronous, started),
+                                       name="users-writer", daemon=True)
+        self.writer.start()
+        started.result()  # e.g. the database cannot be opened: raised here
+
+    def reader(self):
+        """This thread's read-only connection, opened on first use and kept until the thread ends or close()."""
+        reader = getattr(self.local, "reader", None)
+        if reader is None:
+            if self.closed:
+                raise RuntimeError("the pool is closed")
+            # check_same_thread=False only so that close() (or the end of the
+            # thread) can close it from another thread; it is never used by two
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA query_only = ON")
+            reader = _Reader(conn)
+            with self.readers_lock:
+                self.readers.add(reader)
+            self.local.reader = reader
+        return reader.conn
+
+    def read(self, function, *args):
+        """function(connection, *args) on this thread's read connection, e.g. read(users_db.get_user, 1)."""
+        return function(self.reader(), *args)
+
+    def submit(self, function, *args):
+        """Queue function(connection, *args) for the writer and return a Future with its result.
+
+        function runs inside the writer's transaction, so it must not commit
+        or start a transaction itself. If it raises, only its own changes are
+        rolled back and the Future gets the exception.
+        """
+        future = concurrent.futures.Future()
+        with self.closed_lock:
+            if self.closed:
+                raise RuntimeError("the pool is closed")
+            self.queue.put((function, args, future))
+        return future
+
+    def upsert_users(self, rows):
+        """Queue (name, age, email) rows to be inserted or updated; the Future holds the row count."""
+        return self.submit(_upsert, list(rows))
+
+    def _write_loop(self, synchronous, started):
+        try:
+            conn = users_db.connect(self.path, "WAL", synchronous)
+            conn.execute(f"PRAGMA busy_timeout = {int(self.timeout * 1000)}")
+        except BaseException as error:
+            started.set_exception(error)
+            return
+        started.set_result(None)
+        try:
+            stopping = False
+            while not stopping:
+                job = self.queue.get()
+                if job is None:
+                    break
+                jobs = [job]
+                # everything that queued up during the last commit goes into the next one
+                while len(jobs) < self.max_batch:
+                    try:
+                        job = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if job is None:
+                        stopping = True
+                        break
+                    jobs.append(job)
+                self._commit(conn, jobs)
+        finally:
+            conn.close()
+            # normally close() stopped the loop, but if it ended on an error
+            # nothing would run the jobs that are still queued
+            with self.closed_lock:
+                self.closed = True
+            self._fail_queued()
+
+    def _commit(self, conn, jobs):
+        jobs = [job for job in jobs if job[2].set_running_or_notify_cancel()]
+        results = []
+        try:
+            with users_db.transaction(conn):
+                for function, args, _ in jobs:
+                    conn.execute("SAVEPOINT job")
+                    try:
+                        results.append((True, function(conn, *args)))
+                    except BaseException as error:  # even SystemExit must not stop the writer
+                        conn.execute("ROLLBACK TO job")
+                        results.append((False, error))
+                    conn.execute("RELEASE job")
+        except BaseException as error:  # e.g. the disk is full: nothing was written
+            for _, _, future in jobs:
+                future.set_exception(error)
+            return
+        for (_, _, future), (succeeded, result) in zip(jobs, results):
+            if succeeded:
+                future.set_result(result)
+            else:
+                future.set_exception(result)
+
+    def _fail_queued(self):
+        while True:
+            try:
+                job = self.queue.get_nowait()
+            except queue.Empty:
+                return
+            if job is not None and job[2].set_running_or_notify_cancel():
+                job[2].set_exception(RuntimeError("the pool is closed"))
+
+    def close(self):
+        """Commit the queued writes, stop the writer and close every connection."""
+        with self.closed_lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.queue.put(None)
+        self.writer.join()
+        self._fail_queued()
+        with self.readers_lock:
+            for reader in list(self.readers):
+                reader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _Reader:
+    """A thread's read connection. It is closed by close(), or when the thread
+    ends and its threading.local, the only other reference, is freed."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.close = weakref.finalize(self, conn.close)
+
+
+def _upsert(conn, rows):
+    conn.executemany(users_db.UPSERT_SQL, rows)
+    return len(rows)
+
+
+def benchmark(path, rows, threads, writers, seconds):
+    """Run reader threads and writer threads against one pool and print reads/sec and writes/sec."""
+    users_db.remove_database(path)
+    try:
+        conn = users_db.connect(path)
+        users_db.upsert_users(conn, users_db.benchmark_rows(rows), 100000)
+        conn.close()
+        with UsersPool(path) as pool:
+            stop = threading.Event()
+            counts = {"reads": 0, "writes": 0, "errors": 0}
+            countsLock = threading.Lock()
+
+            def readLoop():
+                reads = errors = 0
+                while not stop.is_set():
+                    try:
+                        pool.read(users_db.get_user, random.randint(1, rows))
+                        reads += 1
+                    except sqlite3.OperationalError:
+                        errors += 1
+                with countsLock:
+                    counts["reads"] += reads
+                    counts["errors"] += errors
+
+            def writeLoop():
+                writes = errors = 0
+                while not stop.is_set():
+                    number = random.randrange(rows)
+                    try:
+                        pool.upsert_users(users_db.benchmark_rows(1, number)).result()
+                        writes += 1
+                    except sqlite3.OperationalError:
+                        errors += 1
+                with countsLock:
+                    counts["writes"] += writes
+                    counts["errors"] += errors
+
+            workers = [threading.Thread(target=readLoop) for _ in range(threads)]
+            workers += [threading.Thread(target=writeLoop) for _ in range(writers)]
+            for worker in workers:
+                worker.start()
+            time.sleep(seconds)
+            stop.set()
+            for worker in workers:
+                worker.join()
+        print(f"{threads} readers, {writers} writers: {counts['reads'] / seconds:,.0f} reads/sec, "
+              f"{counts['writes'] / seconds:,.0f} writes/sec, {counts['errors']} lock errors")
+    finally:
+        users_db.remove_database(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure concurrent reads and writes through a UsersPool.")
+    parser.add_argument("--database", default="users_benchmark.db",
+                        help="scratch database file, deleted afterwards (default: users_benchmark.db)")
+    parser.add_argument("--rows", type=int, default=100000, help="users in the table (default: 100000)")
+    parser.add_argument("--threads", type=int, default=8, help="reader threads (default: 8)")
+    parser.add_argument("--writers", type=int, default=4, help="threads writing one user at a time (default: 4)")
+    parser.add_argument("--seconds", type=float, default=5, help="how long to run (default: 5)")
+    args = parser.parse_args()
+    benchmark(args.database, args.rows, args.threads, args.writers, args.seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+import argparse
+import configparser
+import contextlib
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+
+try:
+    import mysql.connector
+    import mysql.connector.pooling
+except ImportError:  # only the SQLite stand-in can be used
+    mysql = None
+
+# Shared connection to the world database for db_manipulation.py and the labs.
+#
+# Opening a MySQL connection costs a TCP handshake and a login, so instead of
+# each query calling mysql.connector.connect(), connections are borrowed from
+# a pool (mysql.connector.pooling) and given back afterwards. query_many()
+# runs a statement as a server-side prepared statement (cursor(prepared=True)):
+# the server parses it once and executes it again for every set of
+# parameters. Write the parameters as %s, as mysql.connector does.
+#
+# The settings come from the [world] section of world_db.ini (next to this
+# file, or the file named by WORLD_DB_CONFIG), then from WORLD_DB_*
+# environment variables, e.g. WORLD_DB_PASSWORD. Keys:
+#
+#     backend    mysql (default) or sqlite
+#     host, port, user, password, database
+#     pool_size  connections kept open (default 5)
+#     sqlite_path  database file for the sqlite backend, relative to this
+#                  directory (default world_sqlite.db, built from world.sql on
+#                  first use)
+#
+# The sqlite backend is a stand-in for trying the labs (and testing) without
+# a MySQL or MariaDB server. It attaches the data as a schema named world, so
+# queries on world.country work unchanged.
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+# a quoted string or name (copied as it is) or a %s placeholder
+PLACEHOLDER_PATTERN = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`|%s")
+
+DEFAULTS = {
+    "backend": "mysql",
+    "host": "localhost",
+    "port": "3306",
+    "user": "root",
+    "password": "",
+    "database": "world",
+    "pool_size": "5",
+    "sqlite_path": os.path.join(DIRECTORY, "world_sqlite.db"),
+}
+
+
+def load_config(path=None):
+    """The connection settings: DEFAULTS, overridden by the config file, overridden by the environment."""
+    config = dict(DEFAULTS)
+    path = path or os.environ.get("WORLD_DB_CONFIG") or os.path.join(DIRECTORY, "world_db.ini")
+    parser = configparser.ConfigParser()
+    if parser.read(path, encoding="utf-8") and parser.has_section("world"):
+        config.update(parser["world"])
+    for key in DEFAULTS:
+        value = os.environ.get("WORLD_DB_" + key.upper())
+        if value is not None:
+            config[key] = value
+    if config["backend"] not in ("mysql", "sqlite"):
+        raise ValueError(f"backend must be mysql or sqlite, not {config['backend']!r}")
+    # a relative path means next to this file, as the default does, not in
+    # whatever directory the lab was started from
+    config["sqlite_path"] = os.path.join(DIRECTORY, os.path.expanduser(config["sqlite_path"]))
+    return config
+
+
+def build_sqlite(sql_path, db_path):
+    """Load the MariaDB dump world.sql into a SQLite database file."""
+    statements = []
+    with open(sql_path, encoding="utf-8") as sqlFile:
+        for statement in sqlFile.read().split(";\n"):
+            # drop the -- and /*! */ comments
+            lines = [line for line in statement.splitlines() if line and not line.startswith(("--", "/*!"))]
+            statement = "\n".join(lines).strip()
+            if statement.startswith("CREATE TABLE"):
+                lines = [line for line in statement.splitlines() if not line.strip().startswith("KEY ")]
+                statement = "\n".join(lines)
+                statement = re.sub(r"enum\([^)]*\)", "TEXT", statement)
+                statement = statement.replace(" AUTO_INCREMENT", "")
+                statement = re.sub(r",\n\)", "\n)", statement)
+                statement = re.sub(r"\n\)[^\n]*$", "\n)", statement)  # ENGINE=InnoDB ...
+            elif statement.startswith("INSERT INTO"):
+                # MySQL escapes quotes in strings with a backslash, SQLite doubles them
+                statement = re.sub(r"\\(.)", lambda match: "''" if match[1] == "'" else match[1], statement)
+            elif statement.startswith("DROP TABLE"):
+                pass
+            else:
+                continue  # LOCK TABLES, CREATE DATABASE, USE ...
+            statements.append(statement)
+    tempPath = f"{db_path}.{os.getpid()}.tmp"
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(tempPath)
+    conn = sqlite3.connect(tempPath)
+    try:
+        conn.executescript("BEGIN;\n" + ";\n".join(statements) + ";\nCOMMIT;")
+    finally:
+        conn.close()
+    os.replace(tempPath, db_path)
+
+
+class SQLitePool:
+    """Stand-in for MySQLConnectionPool: get_connection() hands out SQLite connections that close() gives back.
+
+    SQLite has no server-side prepared statements; instead every connection
+    keeps the statements it compiled in a cache, so a query that is run again
+    is not parsed again either.
+    """
+
+    def __init__(self, path):
+        if not os.path.exists(path):
+            build_sqlite(os.path.join(DIRECTORY, "world.sql"), path)
+        self.path = path
+        self.idle = queue.LifoQueue()
+
+    def get_connection(self):
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            conn = open_sqlite(self.path)
+        return PooledSQLiteConnection(self, conn)
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class PooledSQLiteConnection:
+    def __init__(self, pool, conn):
+        self.pool = pool
+        self.conn = conn
+
+    def cursor(self, prepared=False):
+        return self.conn.cursor()
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        """Give the connection back to the pool (like PooledMySQLConnection.close())."""
+        if self.conn is not None:
+            self.conn.rollback()
+            self.pool.idle.put(self.conn)
+            self.conn = None
+
+
+def open_sqlite(path):
+    # check_same_thread=False: a connection is given back to the pool by one
+    # thread and borrowed by another, but never used by two at once
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    conn.execute("ATTACH DATABASE ? AS world", (path,))
+    return conn
+
+
+def open_mysql(config):
+    """One connection of its own, not from the pool (for comparison)."""
+    return mysql.connector.connect(host=config["host"], port=int(config["port"]), user=config["user"],
+                                   password=config["password"], database=config["database"])
+
+
+class WorldDatabase:
+    """A pool of connections to the world database, safe to use from many threads.
+
+    More threads than pool_size may query at once: the extra ones wait until
+    a connection is given back (MySQLConnectionPool itself would raise
+    PoolError).
+    """
+
+    def __init__(self, config=None):
+        self.config = config or load_config()
+        poolSize = int(self.config["pool_size"])
+        self.sqlite = self.config["backend"] == "sqlite"
+        if self.sqlite:
+            self.pool = SQLitePool(self.config["sqlite_path"])
+        else:
+            if mysql is None:
+                raise RuntimeError("mysql-connector-python is not installed (pip install mysql-connector-python), "
+                                   "or set WORLD_DB_BACKEND=sqlite")
+            self.pool = mysql.connector.pooling.MySQLConnectionPool(
+                pool_name="world", pool_size=poolSize, host=self.config["host"], port=int(self.config["port"]),
+                user=self.config["user"], password=self.config["password"], database=self.config["database"])
+        self.available = threading.BoundedSemaphore(poolSize)
+
+    def sql(self, statement):
+        """The statement with the placeholders of the backend (%s for MySQL, ? for SQLite)."""
+        if not self.sqlite:
+            return statement
+        return PLACEHOLDER_PATTERN.sub(lambda match: "?" if match[0] == "%s" else match[0], statement)
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Borrow a connection for a with block; it goes back to the pool afterwards."""
+        with self.available:
+            conn = self.pool.get_connection()
+            try:
+                yield conn
+            finally:
+                conn.close()
+
+    def query(self, statement, parameters=()):
+        """Run one statement and return all of its rows."""
+        return self.query_many(statement, [parameters])[0]
+
+    def query_many(self, statement, parameter_sets):
+        """Run one statement once per set of parameters and return the rows of each run.
+
+        With more than one set the statement is prepared once and executed for
+        each; a single run uses a plain cursor, since preparing it would cost
+        two more round trips (prepare and close) than sending it as text.
+        """
+        parameter_sets = list(parameter_sets)
+        with self.connection() as conn:
+            cursor = conn.cursor(prepared=len(parameter_sets) > 1)
+            try:
+                results = []
+                for parameters in parameter_sets:
+                    cursor.execute(self.sql(statement), tuple(parameters))
+                    results.append(cursor.fetchall() if cursor.description else [])
+                return results
+            finally:
+                cursor.close()
+
+    def close(self):
+        if self.sqlite:
+            self.pool.close()
+        # MySQLConnectionPool closes its idle connections when it is garbage collected
+
+
+_database = None
+_databaseLock = threading.Lock()
+
+
+def get_database():
+    """The WorldDatabase shared by everything in this process, created on first use."""
+    global _database
+    with _databaseLock:
+        if _database is None:
+            _database = WorldDatabase()
+        return _database
+
+
+def connection():
+    """Borrow a connection from the shared pool: with world_db.connection() as conn: ..."""
+    return get_database().connection()
+
+
+def query(statement, parameters=()):
+    """Run a statement on the shared pool and return all of its rows."""
+    return get_database().query(statement, parameters)
+
+
+def query_many(statement, parameter_sets):
+    return get_database().query_many(statement, parameter_sets)
+
+
+# queries from the labs, used by the benchmark
+BENCHMARK_QUERIES = (
+    ("SELECT name, population FROM city WHERE population > %s", (1000000,)),
+    ("SELECT name, district, population FROM city WHERE countrycode = %s AND district = %s", ("IND", "Delhi")),
+    ("SELECT Name, Region, Population FROM country WHERE Population > %s AND Region = %s ORDER BY Population DESC",
+     (15000000, "South America")),
+    ("SELECT sum(Population), avg(Population), max(Population), min(Population), count(Population) "
+     "FROM world.country", ()),
+)
+
+
+def benchmark(database, queries, threads):
+    """Run the lab queries from many threads, with a new connection per query and through the pool."""
+    def runAll(runQuery):
+        work = queue.Queue()
+        for number in range(queries):
+            work.put(BENCHMARK_QUERIES[number % len(BENCHMARK_QUERIES)])
+
+        def worker():
+            while True:
+                try:
+                    statement, parameters = work.get_nowait()
+                except queue.Empty:
+                    return
+                runQuery(statement, parameters)
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        startTime = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return queries / max(time.perf_counter() - startTime, 1e-9)
+
+    def connectPerQuery(statement, parameters):
+        if database.sqlite:
+            conn = open_sqlite(database.config["sqlite_path"])
+        else:
+            conn = open_mysql(database.config)
+        try:
+            cursor = conn.cursor()
+            cursor.execute(database.sql(statement), parameters)
+            cursor.fetchall()
+        finally:
+            conn.close()
+
+    unpooled = runAll(connectPerQuery)
+    pooled = runAll(database.query)
+    print(f"{queries} queries, {threads} threads, {database.config['backend']}")
+    print(f"new connection per query: {unpooled:>10,.0f} queries/sec")
+    print(f"pooled:                   {pooled:>10,.0f} queries/sec")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Connection pool for the world database.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    queryParser = commands.add_parser("query", help="run a statement and print its rows")
+    queryParser.add_argument("statement")
+    queryParser.add_argument("parameters", nargs="*", help="values for the %%s in the statement")
+    benchmarkParser = commands.add_parser("benchmark", help="compare pooled queries with a connection per query")
+    benchmarkParser.add_argument("--queries", type=int, default=1000, help="queries to run (default: 1000)")
+    benchmarkParser.add_argument("--threads", type=int, default=8, help="threads running them (default: 8)")
+    args = parser.parse_args()
+
+    database = get_database()
+    try:
+        if args.command == "query":
+            for row in database.query(args.statement, args.parameters):
+                print(row)
+        else:
+            benchmark(database, args.queries, args.threads)
+    finally:
+        database.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,51 +1,93 @@
-import csv
-import copy
-
-# The csv module is used to read in the csv file
-# The copy module is used to make a deep copy of the data to store in memory
-
-myVehicle = {
-    "vin" : "<empty>",
-    "make" : "<empty>" ,
-    "model" : "<empty>" ,
-    "year" : 0,
-    "range" : 0,
-    "topSpeed" : 0,
-    "zeroSixty" : 0.0,
-    "mileage" : 0
-}
-
-# a for loop to iterate over the initial keys and values of the dictionary.
-for key,value in myVehicle.items():
-    print("{} -> {}".format(key,value))
-    
-# an empty list to hold the car inventory that will be read
-myInventoryList = []
-
-with open('car_fleet.csv') as csvFile:
-    csvReader = csv.reader(csvFile, delimiter=',')  
-    lineCount = 0  
-    for row in csvReader:
-        if lineCount == 0:
-            print(f'Column names are: {", ".join(row)}')  
-            lineCount += 1  
-        else:  
-            print(f'vin: {row[0]} make: {row[1]}, model: {row[2]}, year: {row[3]}, range: {row[4]}, topSpeed: {row[5]}, zeroSixty: {row[6]}, mileage: {row[7]}')  
-            currentVehicle = copy.deepcopy(myVehicle)  
-            currentVehicle["vin"] = row[0]  
-            currentVehicle["make"] = row[1]  
-            currentVehicle["model"] = row[2]  
-            currentVehicle["year"] = row[3]  
-            currentVehicle["range"] = row[4]  
-            currentVehicle["topSpeed"] = row[5]  
-            currentVehicle["zeroSixty"] = row[6]  
-            currentVehicle["mileage"] = row[7]  
-            myInventoryList.append(currentVehicle)  
-            lineCount += 1  
-    print(f'Processed {lineCount} lines.')
-    
-for myCarProperties in myInventoryList:
-    for key, value in myCarProperties.items():
-        print("{} : {}".format(key,value))
-        print("-----")
+import argparse
+import time
 
+import fleet
+
+# The fleet module reads the csv file straight into typed columns: every
+# number is converted once (no more " 2012" strings) and no dictionary is
+# copied per row. Each car is a fleet.Vehicle with the fields below.
+
+myVehicle = fleet.Vehicle()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read the car inventory from a CSV file.")
+    parser.add_argument("csvFile", nargs="?", default="car_fleet.csv", help="fleet CSV file (default: car_fleet.csv)")
+    parser.add_argument("--quiet", action="store_true", help="only print the number of cars, not every car")
+    parser.add_argument("--group-by", metavar="FIELDS",
+                        help="print count/avg/min/max/sum of range, topSpeed, zeroSixty and mileage "
+                             "per group instead of the cars, e.g. --group-by make,year")
+    parser.add_argument("--jobs", type=int, default=1, help="worker processes for --group-by (default: 1)")
+    parser.add_argument("--vin", help="print only the car with this VIN")
+    parser.add_argument("--between", nargs=3, metavar=("FIELD", "LOW", "HIGH"),
+                        help=f"print the cars with LOW <= FIELD <= HIGH, FIELD one of {', '.join(fleet.indexedFields)}")
+    parser.add_argument("--top", nargs=2, metavar=("FIELD", "COUNT"),
+                        help="print the COUNT cars with the highest FIELD")
+    parser.add_argument("--watch", type=float, metavar="SECONDS",
+                        help="keep the inventory loaded and read the rows appended to the file every SECONDS")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="always parse the CSV file instead of using (and writing) CSVFILE.cache")
+    args = parser.parse_args()
+
+    if args.group_by:
+        # one streaming pass over the file; the cars are not kept in memory
+        groupBy = [name.strip() for name in args.group_by.split(",")]
+        try:
+            groups = fleet.aggregateFleet(args.csvFile, groupBy, jobs=args.jobs)
+        except ValueError as error:
+            parser.error(str(error))
+        fleet.printAggregates(groups, groupBy)
+        return
+
+    if args.watch:
+        repository = fleet.FleetRepository.fromFile(args.csvFile)
+        print(f"{len(repository)} cars")
+        try:
+            while True:
+                time.sleep(args.watch)
+                # only the new part of the file is parsed, unless it was rewritten
+                added, changed, removed = repository.update()
+                if added or changed or removed:
+                    print(f"{added} added, {changed} changed, {removed} removed: {len(repository)} cars")
+        except KeyboardInterrupt:
+            return
+
+    if args.vin or args.between or args.top:
+        field = (args.between or args.top or [None])[0]
+        if field is not None and field not in fleet.indexedFields:
+            parser.error(f"{field} is not indexed, use one of {', '.join(fleet.indexedFields)}")
+        # answered from the repository's indexes instead of scanning the inventory
+        repository = fleet.FleetRepository.fromFile(args.csvFile)
+        if args.vin:
+            vehicle = repository.get(args.vin)
+            cars = [vehicle] if vehicle is not None else []
+        elif args.between:
+            field, low, high = args.between
+            cars = repository.between(field, float(low), float(high))
+        else:
+            cars = repository.top(args.top[0], int(args.top[1]))
+        fleet.printFleet(cars)
+        print(f"{len(cars)} of {len(repository)} cars")
+        return
+
+    if not args.quiet:
+        # a for loop to iterate over the initial keys and values of the vehicle.
+        for key, value in myVehicle.asDict().items():
+            print("{} -> {}".format(key, value))
+        print(f'Column names are: {", ".join(fleet.fieldNames)}')
+
+    # the car inventory, one typed column per field; after the first run it is
+    # memory-mapped from the binary cache next to the csv file
+    if args.no_cache:
+        myInventoryList = fleet.loadFleet(args.csvFile)
+    else:
+        myInventoryList = fleet.loadFleetCached(args.csvFile)
+    print(f'Processed {len(myInventoryList) + 1} lines.')
+
+    if not args.quiet:
+        fleet.printFleet(myInventoryList)
+
+
+# the guard keeps worker processes (--jobs) from running the program again
+if __name__ == "__main__":
+    main()
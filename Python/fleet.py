@@ -0,0 +1,841 @@
+import array
+import bisect
+import concurrent.futures
+import csv
+import hashlib
+import io
+import itertools
+import json
+import mmap
+import operator
+import os
+import sys
+
+# Loader for the car fleet CSV used by composite-data.py.
+#
+# The file looks like this (note the space after each comma):
+#
+#   vin,make,model,year,range,topSpeed,zeroSixty,mileage
+#   TMX20122,AnyCompany Motors, Coupe, 2012, 335, 155, 4.1, 50000
+#
+# Instead of one dict per car, the fleet is stored column by column: the
+# numbers go into typed arrays (4 or 8 bytes per value instead of a str object
+# per value) and the text fields are stripped once and kept in lists. The file
+# is parsed a few megabytes at a time: a chunk without quotes is split on
+# commas in one call, and each column of the chunk is converted with a single
+# map() call, which is much faster than handling the rows field by field.
+
+fieldNames = ("vin", "make", "model", "year", "range", "topSpeed", "zeroSixty", "mileage")
+
+# array typecode of every numeric field; the other fields are text
+numericTypes = {"year": "i", "range": "i", "topSpeed": "i", "zeroSixty": "d", "mileage": "q"}
+numericConverters = {"i": int, "q": int, "d": float}
+
+# text fields with few distinct values; every car shares one string per value
+sharedTextFields = {"make", "model"}
+
+# text read and parsed at a time
+chunkBytes = 4 * 1024 * 1024
+
+# bytes at the start and at the end of the read part of a file that are
+# checked to tell an appended file from a rewritten one
+fingerprintBytes = 64 * 1024
+
+# format of the binary cache written by writeFleetCache()
+cacheVersion = 1
+
+
+class Vehicle:
+    """One car of the fleet, with typed fields."""
+
+    __slots__ = fieldNames
+
+    def __init__(self, vin="<empty>", make="<empty>", model="<empty>", year=0,
+                 range=0, topSpeed=0, zeroSixty=0.0, mileage=0):
+        self.vin = vin
+        self.make = make
+        self.model = model
+        self.year = year
+        self.range = range
+        self.topSpeed = topSpeed
+        self.zeroSixty = zeroSixty
+        self.mileage = mileage
+
+    def asDict(self):
+        return {name: getattr(self, name) for name in fieldNames}
+
+    def __eq__(self, other):
+        if not isinstance(other, Vehicle):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in fieldNames)
+
+    def __repr__(self):
+        return "Vehicle({})".format(", ".join(f"{name}={getattr(self, name)!r}" for name in fieldNames))
+
+
+class FleetColumns:
+    """The fleet stored as one column per field.
+
+    columns["year"] is an array of every car's year, columns["make"] a list of
+    every car's make, and so on. fleet[i] builds a Vehicle for car i.
+    """
+
+    def __init__(self):
+        self.columns = {name: array.array(numericTypes[name]) if name in numericTypes else []
+                        for name in fieldNames}
+
+    def __len__(self):
+        return len(self.columns["vin"])
+
+    def __getitem__(self, index):
+        return Vehicle(*(self.columns[name][index] for name in fieldNames))
+
+    def __iter__(self):
+        for values in zip(*(self.columns[name] for name in fieldNames)):
+            yield Vehicle(*values)
+
+    def column(self, name):
+        return self.columns[name]
+
+    def mutableCopy(self):
+        """A copy whose columns are plain arrays and lists (e.g. of a fleet loaded from the cache)."""
+        fleet = FleetColumns()
+        for name in fieldNames:
+            column = self.columns[name]
+            if isinstance(column, memoryview):
+                fleet.columns[name].frombytes(column.cast("B"))
+            else:
+                fleet.columns[name].extend(column)
+        return fleet
+
+    def append(self, vehicle):
+        for name in fieldNames:
+            self.columns[name].append(getattr(vehicle, name))
+
+    def extendRows(self, rows, firstLine=2):
+        """Convert raw CSV rows (lists of 8 strings) and add them to the columns.
+
+        firstLine is the line number of rows[0], used in error messages.
+        """
+        for number, row in enumerate(rows, start=firstLine):
+            if len(row) != len(fieldNames):
+                raise ValueError(f"line {number}: expected {len(fieldNames)} fields, found {len(row)}")
+        self.extendColumns(list(zip(*rows)) or [()] * len(fieldNames), firstLine)
+
+    def extendColumns(self, values, firstLine=2):
+        """Convert raw column values (one sequence of strings per field) and add them."""
+        converted = []
+        for name, columnValues in zip(fieldNames, values):
+            if name in numericTypes:
+                # int() and float() ignore the leading space themselves
+                converter = numericConverters[numericTypes[name]]
+                try:
+                    converted.append(array.array(numericTypes[name], map(converter, columnValues)))
+                except ValueError:
+                    number = next(number for number, value in enumerate(columnValues, start=firstLine)
+                                  if not isNumber(converter, value))
+                    raise ValueError(f"line {number}: {name} is not a number") from None
+            elif name in sharedTextFields:
+                converted.append(list(map(sys.intern, map(str.strip, columnValues))))
+            else:
+                converted.append(list(map(str.strip, columnValues)))
+        # the columns are only extended once every value converted, so they stay the same length
+        for name, columnValues in zip(fieldNames, converted):
+            self.columns[name].extend(columnValues)
+
+    def extendText(self, text, firstLine=2):
+        """Parse and add CSV text made of whole lines."""
+        if "\r" in text:
+            text = text.replace("\r\n", "\n")
+        if '"' not in text and "\r" not in text:
+            # Plain lines: split the whole chunk at once and take every 8th
+            # field for each column, instead of parsing line by line. Every
+            # line is checked for 7 commas first; comparing only the total
+            # would let a short line and a long one cancel out.
+            lines = text.split("\n")
+            if lines[-1] == "":
+                del lines[-1]
+                if lines and set(map(str.count, lines, itertools.repeat(","))) == {len(fieldNames) - 1}:
+                    fields = ",".join(lines).split(",")
+                    self.extendColumns([fields[column::len(fieldNames)] for column in range(len(fieldNames))],
+                                       firstLine)
+                    return
+        # quoted fields, blank lines or a wrong number of fields: let csv sort it out
+        rows = list(csv.reader(io.StringIO(text)))
+        self.extendRows([row for row in rows if row], firstLine)
+
+
+def isNumber(converter, value):
+    try:
+        converter(value)
+    except ValueError:
+        return False
+    return True
+
+
+def readHeader(fleetFile, path):
+    """Read and check the header line of a fleet file opened in binary mode."""
+    header = [name.strip() for name in next(csv.reader([fleetFile.readline().decode("utf-8")]), [])]
+    if header and tuple(header) != fieldNames:
+        raise ValueError(f"{path}: unexpected columns {header}")
+
+
+def iterTextChunks(fleetFile, end=None, terminatedOnly=False):
+    """Yield (text, lineCount) for the whole lines of a binary file, a few megabytes at a time.
+
+    Reading starts at the current position. If end is given, only the lines
+    that start before that byte offset are read. With terminatedOnly, a last
+    line without a line break is not read: the file is left positioned at its
+    start.
+    """
+    position = fleetFile.tell()
+    while end is None or position < end:
+        # readlines() stops once it has read hint bytes, so the lines it
+        # returns start at or before position + hint
+        hint = chunkBytes if end is None else min(chunkBytes, end - position)
+        lines = fleetFile.readlines(hint)
+        if end is not None:
+            # a line that starts exactly at end belongs to the next range
+            lineStart = position
+            for count, line in enumerate(lines):
+                if lineStart >= end:
+                    fleetFile.seek(lineStart)
+                    del lines[count:]
+                    break
+                lineStart += len(line)
+        if not lines:
+            break
+        # a quoted field may run over several lines; keep them together
+        while sum(line.count(b'"') for line in lines) % 2:
+            nextLine = fleetFile.readline()
+            if not nextLine:
+                break
+            lines.append(nextLine)
+        if terminatedOnly and not lines[-1].endswith(b"\n"):
+            fleetFile.seek(-len(lines.pop()), os.SEEK_CUR)
+            if lines:
+                yield b"".join(lines).decode("utf-8"), len(lines)
+            break
+        position += sum(map(len, lines))
+        text = b"".join(lines).decode("utf-8")
+        if not text.endswith("\n"):
+            text += "\n"
+        yield text, len(lines)
+
+
+def readFleetFrom(path, offset=0, firstLine=2, growing=False):
+    """Parse the lines of a fleet file from byte offset on (0 means the start, header included).
+
+    Returns (fleet, nextOffset, lineCount). A last line without a line break
+    may still be being written, so nextOffset is its start and it is read
+    again next time. It is added now as well; if it does not parse, it raises
+    ValueError like any other line, unless growing is true (the file is being
+    appended to), in which case it is left for the next read.
+    """
+    fleet = FleetColumns()
+    with open(path, "rb") as fleetFile:
+        lineCount = 0
+        if offset == 0:
+            readHeader(fleetFile, path)
+            lineCount = 1
+        else:
+            fleetFile.seek(offset)
+        lineNumber = firstLine
+        for text, chunkLines in iterTextChunks(fleetFile, terminatedOnly=True):
+            try:
+                fleet.extendText(text, lineNumber)
+            except ValueError as error:
+                raise ValueError(f"{path}: {error}") from None
+            lineNumber += chunkLines
+            lineCount += chunkLines
+        nextOffset = fleetFile.tell()
+        lastLine = fleetFile.read()
+    if lastLine.strip():
+        try:
+            fleet.extendText(lastLine.decode("utf-8") + "\n", lineNumber)
+        except ValueError as error:  # UnicodeDecodeError too
+            # a line that is still being written may end in the middle of a field
+            if not growing:
+                raise ValueError(f"{path}: {error}") from None
+    return fleet, nextOffset, lineCount
+
+
+def fileFingerprint(path, offset):
+    """Identify the first offset bytes of a file: (device, inode, digest of its head and tail).
+
+    Only up to 2 * fingerprintBytes are read, however long the file is.
+    """
+    with open(path, "rb") as fleetFile:
+        stat = os.fstat(fleetFile.fileno())
+        head = fleetFile.read(min(offset, fingerprintBytes))
+        tailStart = max(offset - fingerprintBytes, len(head))
+        fleetFile.seek(tailStart)
+        tail = fleetFile.read(offset - tailStart)
+    return stat.st_dev, stat.st_ino, hashlib.sha256(head + tail).hexdigest()
+
+
+def loadFleet(path="car_fleet.csv"):
+    """Read a fleet CSV file into a FleetColumns."""
+    fleet = FleetColumns()
+    with open(path, "rb") as fleetFile:
+        readHeader(fleetFile, path)
+        lineNumber = 2
+        for text, lineCount in iterTextChunks(fleetFile):
+            try:
+                fleet.extendText(text, lineNumber)
+            except ValueError as error:
+                raise ValueError(f"{path}: {error}") from None
+            lineNumber += lineCount
+    return fleet
+
+
+class TextColumn:
+    """Read-only column of strings stored as UTF-8 bytes plus the offset of every string."""
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[position] for position in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("column index out of range")
+        return str(self.data[self.offsets[index]:self.offsets[index + 1]], "utf-8")
+
+    def __iter__(self):
+        data = self.data
+        for start, end in zip(self.offsets, self.offsets[1:]):
+            yield str(data[start:end], "utf-8")
+
+
+class CodedColumn:
+    """Read-only column of strings stored as a code per row and the list of distinct values."""
+
+    def __init__(self, codes, values):
+        self.codes = codes
+        self.values = values
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(map(self.values.__getitem__, self.codes[index]))
+        return self.values[self.codes[index]]
+
+    def __iter__(self):
+        return map(self.values.__getitem__, self.codes)
+
+
+def cachePath(path):
+    """Directory that holds the binary cache of a fleet CSV file."""
+    return path + ".cache"
+
+
+def writeFleetCache(fleet, path, sourceStat):
+    """Write fleet as one binary file per column, stamped with the size and mtime of the CSV file.
+
+    Numbers are stored as little-endian arrays, the VINs as UTF-8 text plus
+    offsets, and makes and models as a code per car plus the distinct values
+    (kept in meta.json). meta.json is written last, so a cache that was only
+    partly written is never used.
+    """
+    directory = cachePath(path)
+    os.makedirs(directory, exist_ok=True)
+
+    def writeFile(name, data):
+        tempPath = os.path.join(directory, name + ".tmp")
+        with open(tempPath, "wb") as cacheFile:
+            cacheFile.write(data)
+        os.replace(tempPath, os.path.join(directory, name))
+
+    def littleEndian(values):
+        if sys.byteorder == "big":
+            values.byteswap()
+        return values
+
+    meta = {"version": cacheVersion, "sourceSize": sourceStat.st_size, "sourceMtimeNs": sourceStat.st_mtime_ns,
+            "count": len(fleet), "itemSizes": {}, "textBytes": {}, "values": {}}
+    for name in fieldNames:
+        column = fleet.columns[name]
+        if name in numericTypes:
+            values = array.array(numericTypes[name], column)
+            meta["itemSizes"][name] = values.itemsize
+            writeFile(name + ".bin", littleEndian(values))
+        elif name in sharedTextFields:
+            codesByValue = {}
+            codes = array.array("I", (codesByValue.setdefault(value, len(codesByValue)) for value in column))
+            meta["values"][name] = list(codesByValue)
+            writeFile(name + ".codes", littleEndian(codes))
+        else:
+            encoded = [value.encode("utf-8") for value in column]
+            offsets = array.array("Q", itertools.accumulate(map(len, encoded), initial=0))
+            meta["textBytes"][name] = offsets[-1]
+            writeFile(name + ".offsets", littleEndian(offsets))
+            writeFile(name + ".text", b"".join(encoded))
+    writeFile("meta.json", json.dumps(meta).encode("utf-8"))
+
+
+def mapCacheFile(directory, name, size, typecode=None):
+    """Memory-map one cache file as a read-only memoryview (of typecode items, if given)."""
+    with open(os.path.join(directory, name), "rb") as cacheFile:
+        if os.fstat(cacheFile.fileno()).st_size != size:
+            raise ValueError(f"{name} has the wrong size")
+        view = memoryview(mmap.mmap(cacheFile.fileno(), 0, access=mmap.ACCESS_READ) if size else b"")
+    if typecode is None:
+        return view
+    if sys.byteorder == "big":
+        values = array.array(typecode)
+        values.frombytes(view)
+        values.byteswap()
+        return values
+    return view.cast(typecode)
+
+
+def loadFleetCache(path):
+    """Return the cached fleet of a CSV file, or None if there is no cache or the file changed since.
+
+    The columns are memory-mapped, so nothing is read until it is used. The
+    returned FleetColumns is read-only; use mutableCopy() to change it.
+    """
+    directory = cachePath(path)
+    try:
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as metaFile:
+            meta = json.load(metaFile)
+        stat = os.stat(path)
+        if (meta.get("version") != cacheVersion
+                or (meta["sourceSize"], meta["sourceMtimeNs"]) != (stat.st_size, stat.st_mtime_ns)):
+            return None
+        count = meta["count"]
+        fleet = FleetColumns()
+        for name in fieldNames:
+            if name in numericTypes:
+                typecode = numericTypes[name]
+                if array.array(typecode).itemsize != meta["itemSizes"][name]:
+                    return None
+                fleet.columns[name] = mapCacheFile(directory, name + ".bin", count * meta["itemSizes"][name],
+                                                   typecode)
+            elif name in sharedTextFields:
+                codes = mapCacheFile(directory, name + ".codes", count * 4, "I")
+                fleet.columns[name] = CodedColumn(codes, [sys.intern(value) for value in meta["values"][name]])
+            else:
+                offsets = mapCacheFile(directory, name + ".offsets", (count + 1) * 8, "Q")
+                data = mapCacheFile(directory, name + ".text", meta["textBytes"][name])
+                fleet.columns[name] = TextColumn(offsets, data)
+    except (OSError, ValueError, KeyError, TypeError):
+        return None  # no cache, or a damaged one: it is rebuilt
+    return fleet
+
+
+def loadFleetCached(path="car_fleet.csv"):
+    """loadFleet() through the binary cache: read the cache if it is up to date, else parse and rewrite it.
+
+    The result is read-only if it came from the cache (see loadFleetCache()).
+    """
+    fleet = loadFleetCache(path)
+    if fleet is not None:
+        return fleet
+    # the file is stat'ed before it is read, so a change during the read
+    # makes the new cache out of date rather than wrong
+    stat = os.stat(path)
+    fleet = loadFleet(path)
+    try:
+        writeFleetCache(fleet, path, stat)
+    except OSError:
+        pass  # e.g. a read-only directory: the cache is only an optimization
+    return fleet
+
+
+# fields summarized by aggregateFleet() by default
+aggregatedFields = ("range", "topSpeed", "zeroSixty", "mileage")
+
+
+class FieldStats:
+    """count, sum, min and max of one field over a group of cars."""
+
+    __slots__ = ("count", "total", "minimum", "maximum")
+
+    def __init__(self, count=0, total=0, minimum=None, maximum=None):
+        self.count = count
+        self.total = total
+        self.minimum = minimum
+        self.maximum = maximum
+
+    @property
+    def average(self):
+        return self.total / self.count if self.count else None
+
+    def addValues(self, values):
+        self.merge(FieldStats(len(values), sum(values), min(values), max(values)))
+
+    def merge(self, other):
+        if not other.count:
+            return
+        self.count += other.count
+        self.total += other.total
+        self.minimum = other.minimum if self.minimum is None else min(self.minimum, other.minimum)
+        self.maximum = other.maximum if self.maximum is None else max(self.maximum, other.maximum)
+
+    def __repr__(self):
+        return (f"FieldStats(count={self.count}, total={self.total!r}, "
+                f"minimum={self.minimum!r}, maximum={self.maximum!r})")
+
+
+def aggregateColumns(fleet, groupBy, fields, groups):
+    """Add the cars of a FleetColumns to groups: {groupKey: {field: FieldStats}}."""
+    positions = {}
+    for position, key in enumerate(zip(*(fleet.columns[name] for name in groupBy))):
+        positions.setdefault(key, []).append(position)
+    for key, keyPositions in positions.items():
+        groupStats = groups.get(key)
+        if groupStats is None:
+            groupStats = groups[key] = {field: FieldStats() for field in fields}
+        # itemgetter picks this group's values out of each column in C
+        pick = operator.itemgetter(*keyPositions)
+        for field in fields:
+            values = pick(fleet.columns[field])
+            groupStats[field].addValues(values if len(keyPositions) > 1 else (values,))
+
+
+def mergeGroups(groups, otherGroups):
+    for key, otherStats in otherGroups.items():
+        groupStats = groups.get(key)
+        if groupStats is None:
+            groups[key] = otherStats
+        else:
+            for field, stats in otherStats.items():
+                groupStats[field].merge(stats)
+
+
+def aggregateRange(task):
+    """Aggregate the lines that start in [start, end) of a fleet file.
+
+    task is (path, start, end, headerEnd, groupBy, fields) so it can be sent to
+    a worker process. A range that starts inside a line skips to the next one.
+    """
+    path, start, end, headerEnd, groupBy, fields = task
+    groups = {}
+    with open(path, "rb") as fleetFile:
+        if start > headerEnd:
+            fleetFile.seek(start - 1)
+            fleetFile.readline()  # the rest of the line that was cut
+        else:
+            fleetFile.seek(headerEnd)
+        lineNumber = 1
+        for text, lineCount in iterTextChunks(fleetFile, end):
+            chunk = FleetColumns()
+            try:
+                chunk.extendText(text, lineNumber)
+            except ValueError as error:
+                raise ValueError(f"{path} (counting lines from byte {start}): {error}") from None
+            aggregateColumns(chunk, groupBy, fields, groups)
+            lineNumber += lineCount
+    return groups
+
+
+def aggregateFleet(path="car_fleet.csv", groupBy=("make",), fields=aggregatedFields, jobs=1):
+    """Summarize a fleet CSV file in one pass, grouped by one or more fields.
+
+    Returns {groupKey: {field: FieldStats}} where groupKey is a tuple with the
+    value of every groupBy field, e.g. aggregateFleet(groupBy=("make", "year"))
+    has keys like ("AnyCompany Motors", 2012). Only a chunk of the file and
+    one FieldStats per group and field are kept in memory. With jobs > 1 the
+    file is cut into byte ranges that are aggregated by worker processes; this
+    needs one car per line (no line breaks inside quoted fields).
+    """
+    groupBy, fields = tuple(groupBy), tuple(fields)
+    for name in groupBy + fields:
+        if name not in fieldNames:
+            raise ValueError(f"unknown field {name!r}")
+    with open(path, "rb") as fleetFile:
+        readHeader(fleetFile, path)
+        headerEnd = fleetFile.tell()
+    size = os.path.getsize(path)
+    if jobs <= 1:
+        return aggregateRange((path, headerEnd, size, headerEnd, groupBy, fields))
+
+    rangeSize = max(chunkBytes, -(-(size - headerEnd) // (jobs * 4)))
+    tasks = ((path, start, min(start + rangeSize, size), headerEnd, groupBy, fields)
+             for start in range(headerEnd, size, rangeSize))
+    groups = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        # keep at most two ranges per worker in flight
+        pending = [executor.submit(aggregateRange, task) for task in itertools.islice(tasks, jobs * 2)]
+        while pending:
+            mergeGroups(groups, pending.pop(0).result())
+            pending.extend(executor.submit(aggregateRange, task) for task in itertools.islice(tasks, 1))
+    return groups
+
+
+def printAggregates(groups, groupBy=("make",)):
+    for key in sorted(groups):
+        groupStats = groups[key]
+        count = next(iter(groupStats.values())).count if groupStats else 0
+        print(", ".join(f"{name}: {value}" for name, value in zip(groupBy, key)) + f" ({count} cars)")
+        for field, stats in groupStats.items():
+            print(f"    {field}: avg {stats.average:.2f}, min {stats.minimum}, max {stats.maximum}, sum {stats.total}")
+
+
+# numeric fields FleetRepository keeps sorted indexes on
+indexedFields = ("year", "mileage", "range")
+
+
+class SortedIndex:
+    """Positions of the cars ordered by one numeric field (ties by position).
+
+    values and positions are parallel typed arrays, so lookups are C-level
+    bisects and an insert or removal is one bisect plus an array memmove.
+    """
+
+    def __init__(self, column, livePositions):
+        order = sorted(livePositions, key=column.__getitem__)
+        self.values = array.array(column.typecode, map(column.__getitem__, order))
+        self.positions = array.array("q", order)
+
+    def _find(self, value, position):
+        first = bisect.bisect_left(self.values, value)
+        last = bisect.bisect_right(self.values, value, first)
+        return bisect.bisect_left(self.positions, position, first, last)
+
+    def insert(self, value, position):
+        index = self._find(value, position)
+        self.values.insert(index, value)
+        self.positions.insert(index, position)
+
+    def insertMany(self, entries):
+        """Insert a list of (value, position) pairs, copying the arrays only once."""
+        if len(entries) < 16:
+            for value, position in entries:
+                self.insert(value, position)
+            return
+        values = array.array(self.values.typecode)
+        positions = array.array("q")
+        previous = 0
+        for value, position in sorted(entries):
+            index = self._find(value, position)
+            values.extend(self.values[previous:index])
+            positions.extend(self.positions[previous:index])
+            values.append(value)
+            positions.append(position)
+            previous = index
+        values.extend(self.values[previous:])
+        positions.extend(self.positions[previous:])
+        self.values, self.positions = values, positions
+
+    def remove(self, value, position):
+        index = self._find(value, position)
+        del self.values[index]
+        del self.positions[index]
+
+    def between(self, low=None, high=None):
+        """Positions of the cars with low <= value <= high, in value order."""
+        first = 0 if low is None else bisect.bisect_left(self.values, low)
+        last = len(self.values) if high is None else bisect.bisect_right(self.values, high)
+        return self.positions[first:last]
+
+
+class FleetRepository:
+    """Fleet with indexes: VIN and make lookups are O(1), range and top-N queries O(log n).
+
+    The cars live in a FleetColumns. A removed car leaves a free position that
+    the next new car reuses, so positions (and the index entries pointing at
+    them) never have to move.
+    """
+
+    def __init__(self, fleet=None):
+        if fleet is None:
+            fleet = FleetColumns()
+        elif any(isinstance(column, (memoryview, TextColumn, CodedColumn)) for column in fleet.columns.values()):
+            # read-only columns, e.g. from loadFleetCached(): the repository changes them
+            fleet = fleet.mutableCopy()
+        self.fleet = fleet
+        vins = self.fleet.columns["vin"]
+        # with duplicate VINs the last row wins, as it would on an update
+        self.positionByVin = {vin: position for position, vin in enumerate(vins)}
+        livePositions = sorted(self.positionByVin.values())
+        live = set(livePositions)
+        self.freePositions = [position for position in range(len(vins)) if position not in live]
+        self.positionsByMake = {}
+        makes = self.fleet.columns["make"]
+        for position in livePositions:
+            self.positionsByMake.setdefault(makes[position], set()).add(position)
+        self.sortedIndexes = {field: SortedIndex(self.fleet.columns[field], livePositions)
+                              for field in indexedFields}
+        # set by fromFile(), refresh() and update()
+        self.path = None
+        self.offset = self.lineCount = 0
+        self.fileStat = self.fingerprint = None
+
+    @classmethod
+    def fromFile(cls, path="car_fleet.csv"):
+        fleet, offset, lineCount = readFleetFrom(path)
+        repository = cls(fleet)
+        repository._rememberFile(path, offset, lineCount)
+        return repository
+
+    def _rememberFile(self, path, offset, lineCount):
+        """Record how far path has been read, for update()."""
+        stat = os.stat(path)
+        self.path = path
+        self.offset = offset
+        self.lineCount = lineCount
+        self.fileStat = (stat.st_size, stat.st_mtime_ns)
+        self.fingerprint = fileFingerprint(path, offset)
+
+    def __len__(self):
+        return len(self.positionByVin)
+
+    def __contains__(self, vin):
+        return vin in self.positionByVin
+
+    def __iter__(self):
+        for position in sorted(self.positionByVin.values()):
+            yield self.fleet[position]
+
+    def get(self, vin):
+        """The Vehicle with this VIN, or None."""
+        position = self.positionByVin.get(vin)
+        return None if position is None else self.fleet[position]
+
+    def byMake(self, make):
+        return [self.fleet[position] for position in sorted(self.positionsByMake.get(make, ()))]
+
+    def between(self, field, low=None, high=None):
+        """Cars with low <= field <= high (None means no limit), ordered by field."""
+        return [self.fleet[position] for position in self.sortedIndexes[field].between(low, high)]
+
+    def top(self, field, count, largest=True):
+        """The count cars with the largest (or smallest) field values."""
+        positions = self.sortedIndexes[field].positions
+        if largest:
+            positions = reversed(positions[max(len(positions) - count, 0):])
+        else:
+            positions = positions[:count]
+        return [self.fleet[position] for position in positions]
+
+    def _indexRow(self, position, newPositions=None):
+        """Add a row to the indexes; with newPositions, the sorted indexes are left to the caller."""
+        columns = self.fleet.columns
+        self.positionByVin[columns["vin"][position]] = position
+        self.positionsByMake.setdefault(columns["make"][position], set()).add(position)
+        if newPositions is not None:
+            newPositions.append(position)
+            return
+        for field, index in self.sortedIndexes.items():
+            index.insert(columns[field][position], position)
+
+    def _unindexRow(self, position):
+        columns = self.fleet.columns
+        del self.positionByVin[columns["vin"][position]]
+        positions = self.positionsByMake[columns["make"][position]]
+        positions.discard(position)
+        if not positions:
+            del self.positionsByMake[columns["make"][position]]
+        for field, index in self.sortedIndexes.items():
+            index.remove(columns[field][position], position)
+
+    def put(self, vehicle):
+        """Add a car, or replace the car with the same VIN; return True if anything changed."""
+        values = tuple(getattr(vehicle, name) for name in fieldNames)
+        return self._putRow(values)
+
+    def _putRow(self, values, newPositions=None):
+        columns = self.fleet.columns
+        position = self.positionByVin.get(values[0])
+        if position is not None:
+            if all(columns[name][position] == value for name, value in zip(fieldNames, values)):
+                return False
+            self._unindexRow(position)
+        elif self.freePositions:
+            position = self.freePositions.pop()
+        else:
+            position = len(self.fleet)
+            self.fleet.append(Vehicle(*values))
+            self._indexRow(position, newPositions)
+            return True
+        for name, value in zip(fieldNames, values):
+            columns[name][position] = value
+        self._indexRow(position, newPositions)
+        return True
+
+    def remove(self, vin):
+        position = self.positionByVin[vin]
+        self._unindexRow(position)
+        self.freePositions.append(position)
+
+    def _putColumns(self, newFleet):
+        """put() every row of a FleetColumns; return (added, changed, VINs seen).
+
+        If a VIN is in newFleet more than once, its last row wins. New rows
+        are added to the sorted indexes together at the end, which copies
+        each index once instead of once per row.
+        """
+        rows = {values[0]: values for values in zip(*(newFleet.columns[name] for name in fieldNames))}
+        added = changed = 0
+        newPositions = []
+        for vin, values in rows.items():
+            existed = vin in self.positionByVin
+            if self._putRow(values, newPositions):
+                if existed:
+                    changed += 1
+                else:
+                    added += 1
+        for field, index in self.sortedIndexes.items():
+            column = self.fleet.columns[field]
+            index.insertMany([(column[position], position) for position in newPositions])
+        return added, changed, rows.keys()
+
+    def refresh(self, path="car_fleet.csv"):
+        """Re-read the whole CSV file and apply only the differences to the indexes.
+
+        Returns (added, changed, removed) counts.
+        """
+        newFleet, offset, lineCount = readFleetFrom(path)
+        added, changed, seen = self._putColumns(newFleet)
+        removed = [vin for vin in self.positionByVin if vin not in seen]
+        for vin in removed:
+            self.remove(vin)
+        self._rememberFile(path, offset, lineCount)
+        return added, changed, len(removed)
+
+    def update(self, path=None):
+        """Read only the lines appended to the CSV file since it was last read.
+
+        A row with a VIN that is already known replaces that car. A last line
+        without a line break is read (again) every time, as fromFile() does.
+        If the file was rewritten rather than appended to (it shrank, was
+        replaced, or the part read before changed), everything is re-read
+        with refresh().
+        Returns (added, changed, removed) counts.
+        """
+        path = path or self.path
+        if path is None:
+            raise ValueError("no fleet file has been read yet")
+        if self.path != path:
+            return self.refresh(path)
+        stat = os.stat(path)
+        if (stat.st_size, stat.st_mtime_ns) == self.fileStat:
+            return 0, 0, 0
+        if stat.st_size < self.offset or fileFingerprint(path, self.offset) != self.fingerprint:
+            return self.refresh(path)
+        # A last line without a line break is added now, as fromFile() does.
+        # offset stays at its start, so it is read again once it grows: it
+        # only parses with all 8 fields, so its VIN is whole and reading it
+        # again replaces a value that was cut off (the last field).
+        newFleet, offset, lineCount = readFleetFrom(path, self.offset, self.lineCount + 1, growing=True)
+        added, changed, _ = self._putColumns(newFleet)
+        self._rememberFile(path, offset, self.lineCount + lineCount)
+        return added, changed, 0
+
+
+def printFleet(fleet):
+    for vehicle in fleet:
+        for key, value in vehicle.asDict().items():
+            print("{} : {}".format(key, value))
+            print("-----")
@@ -1,51 +1,296 @@
+import argparse
+import array
+import bisect
+import collections
+import concurrent.futures
+import csv
+import gzip
+import itertools
+import os
+import sys
+import time
+
 # Store the human preproinsulin sequence in a variable called preproinsulin:
 
 preproInsulin = "malwmrllpllallalwgpdpaaafvnqhlcgshlvealylvcgergffytpktr" \
 "reaedlqvgqvelgggpgagslqplalegslqkrgiveqcctsicslyqlenycn"
 
-# Store the remaining sequence elements of human insulin in variables:
+# Enzymes that cut human preproinsulin into its chains, as
+# name -> (motif, position of the cut inside the motif):
+#   signal peptidase removes the signal peptide after ...PAAA,
+#   PC1/3 cuts at the RR pair between the B chain and the C peptide,
+#   PC2 cuts after the KR pair between the C peptide and the A chain.
+cleavageSites = {
+    "signal peptidase": ("PAAA", 4),
+    "PC1/3": ("RR", 0),
+    "PC2": ("KR", 2),
+}
 
-lsInsulin = "malwmrllpllallalwgpdpaaa"
 
-bInsulin = "fvnqhlcgshlvealylvcgergffytpkt"
+class MotifIndex:
+    """k-mer index over a set of protein sequences.
 
-aInsulin = "giveqcctsicslyqlenycn"
+    The index is built once; every k letter substring maps to the positions
+    where it occurs. A peptide search only verifies the positions of its
+    rarest k-mer instead of rescanning every sequence with str.find.
+    """
 
-cInsulin = "rreaedlqvgqvelgggpgagslqplalegslqkr"
+    def __init__(self, sequences, k=3):
+        """sequences is a dict of name -> sequence, or a list of sequences (named by position)."""
+        if not isinstance(sequences, dict):
+            sequences = {str(number): sequence for number, sequence in enumerate(sequences)}
+        self.k = k
+        self.names = list(sequences)
+        self.sequences = list(sequences.values())
+        # all sequences joined with "$" so no match can span two of them; the
+        # padding gives every residue a full k-mer
+        self.starts = []
+        position = 0
+        for sequence in self.sequences:
+            self.starts.append(position)
+            position += len(sequence) + 1
+        self.text = "$".join(self.sequences).upper() + "$" * k
+        self.kmers = collections.defaultdict(lambda: array.array("I"))
+        text = self.text
+        for start, sequence in zip(self.starts, self.sequences):
+            for position in range(start, start + len(sequence)):
+                self.kmers[text[position:position + k]].append(position)
+        self.kmers = dict(self.kmers)
+        # sorted k-mers let peptides shorter than k be found by prefix
+        self.sortedKmers = sorted(self.kmers)
 
-# merge the results of the smaller insulin groupings into a single variable called insulin. 
+    def findPositions(self, peptide):
+        """Return the sorted positions of peptide in the joined text."""
+        peptide = peptide.upper()
+        k = self.k
+        if not peptide or "$" in peptide:
+            return []
+        if len(peptide) < k:
+            first = bisect.bisect_left(self.sortedKmers, peptide)
+            last = bisect.bisect_left(self.sortedKmers, peptide + "\U0010ffff")
+            return sorted(itertools.chain.from_iterable(self.kmers[kmer] for kmer in self.sortedKmers[first:last]))
+        # the rarest k-mer of the peptide has the fewest candidates to check
+        candidateLists = []
+        for offset in range(len(peptide) - k + 1):
+            positions = self.kmers.get(peptide[offset:offset + k])
+            if positions is None:
+                return []
+            candidateLists.append((len(positions), offset, positions))
+        _, offset, positions = min(candidateLists)
+        text = self.text
+        return [position - offset for position in positions
+                if text.startswith(peptide, position - offset)]
 
-insulin = bInsulin + aInsulin
+    def find(self, peptide):
+        """Return [(sequenceName, position), ...] for every occurrence of peptide (positions start at 0)."""
+        matches = []
+        for position in self.findPositions(peptide):
+            number = bisect.bisect_right(self.starts, position) - 1
+            matches.append((self.names[number], position - self.starts[number]))
+        return matches
+
+    def findCleavageSites(self, sites=cleavageSites):
+        """Return {sequenceName: [(cutPosition, siteName), ...]} with the cuts sorted by position."""
+        cuts = collections.defaultdict(list)
+        for siteName, (motif, cutOffset) in sites.items():
+            for name, position in self.find(motif):
+                cuts[name].append((position + cutOffset, siteName))
+        return {name: sorted(siteCuts) for name, siteCuts in cuts.items()}
+
+    def cleave(self, name, sites=cleavageSites):
+        """Split the named sequence at its cleavage sites and return the fragments."""
+        sequence = self.sequences[self.names.index(name)]
+        fragments = []
+        previousCut = 0
+        for cut, _ in self.findCleavageSites(sites).get(name, []):
+            fragments.append(sequence[previousCut:cut])
+            previousCut = cut
+        fragments.append(sequence[previousCut:])
+        return fragments
 
-# Printing "the sequence of human insulin" to console using successive print() commands:
 
-print("The sequence of human preproinsulin:")
+def extractInsulinChains(sequence):
+    """Split preproinsulin into (lsInsulin, bInsulin, cInsulin, aInsulin) at its cleavage sites."""
+    fragments = MotifIndex({"preproinsulin": sequence}).cleave("preproinsulin")
+    if len(fragments) != 4:
+        raise ValueError(f"expected 3 cleavage sites in preproinsulin, found {len(fragments) - 1}")
+    return tuple(fragments)
 
-print(preproInsulin)
+# Store the remaining sequence elements of human insulin in variables. They are
+# found by cutting preproinsulin at its cleavage sites:
+# lsInsulin = "malwmrllpllallalwgpdpaaa"
+# bInsulin = "fvnqhlcgshlvealylvcgergffytpkt"
+# cInsulin = "rreaedlqvgqvelgggpgagslqplalegslqkr"
+# aInsulin = "giveqcctsicslyqlenycn"
 
-# Printing to console using concatenated strings inside the print function (one-liner):
+lsInsulin, bInsulin, cInsulin, aInsulin = extractInsulinChains(preproInsulin)
 
-print("The sequence of human insulin, chain a: " + aInsulin)
+# merge the results of the smaller insulin groupings into a single variable called insulin.
 
+insulin = bInsulin + aInsulin
 
 
-# Calculating the molecular weight of insulin  
-# Creating a list of the amino acid (AA) weights  
+# Calculating the molecular weight of insulin
+# Creating a list of the amino acid (AA) weights
 aaWeights = {'A': 89.09, 'C': 121.16, 'D': 133.10, 'E': 147.13, 'F': 165.19,
 'G': 75.07, 'H': 155.16, 'I': 131.17, 'K': 146.19, 'L': 131.17, 'M': 149.21,
 'N': 132.12, 'P': 115.13, 'Q': 146.15, 'R': 174.20, 'S': 105.09, 'T': 119.12,
-'V': 117.15, 'W': 204.23, 'Y': 181.19}  
-# Count the number of each amino acids  
-aaCountInsulin = ({x: float(insulin.upper().count(x)) for x in ['A', 'C',
-'D', 'E', 'F', 'G', 'H', 'I', 'K', 'L', 'M', 'N', 'P', 'Q', 'R', 'S', 'T',
-'V', 'W', 'Y']})  
-# Multiply the count by the weights  
-molecularWeightInsulin = sum({x: (aaCountInsulin[x]*aaWeights[x]) for x in
-['A', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'K', 'L', 'M', 'N', 'P', 'Q', 'R',
-'S', 'T', 'V', 'W', 'Y']}.values())  
-print("The rough molecular weight of insulin: " +
-str(molecularWeightInsulin))
-
-molecularWeightInsulinActual = 5807.63
-print("Error percentage: " + str(((molecularWeightInsulin - molecularWeightInsulinActual)/molecularWeightInsulinActual)*100))
+'V': 117.15, 'W': 204.23, 'Y': 181.19}
+
+# Count every amino acid and add up the molecular weight. The sequence is
+# upper-cased once (not once per amino acid) and each count is a C-level
+# str.count() scan; the weights are summed directly instead of through a
+# throwaway dict.
+def analyzeSequence(sequence):
+    """Return (aaCount, molecularWeight) for a protein sequence.
+
+    aaCount maps each of the 20 amino acids in aaWeights to its count (as a
+    float); letters that are not amino acids are ignored.
+    """
+    uppercaseSequence = sequence.upper()
+    aaCount = {aa: float(uppercaseSequence.count(aa)) for aa in aaWeights}
+    molecularWeight = sum(aaCount[aa] * weight for aa, weight in aaWeights.items())
+    return aaCount, molecularWeight
+
+
+# Read a FASTA file one record at a time. Only the record being read is kept in
+# memory, so whole-proteome dumps (optionally gzipped) can be processed without
+# loading the file.
+def readFasta(path):
+    """Yield (header, sequence) for every record in a FASTA file ("-" reads stdin)."""
+    if path == "-":
+        fastaFile = sys.stdin
+    elif path.endswith(".gz"):
+        fastaFile = gzip.open(path, "rt")
+    else:
+        fastaFile = open(path)
+    try:
+        header = None
+        sequenceLines = []
+        for line in fastaFile:
+            line = line.strip()
+            if not line or line.startswith(";"):
+                continue
+            if line.startswith(">"):
+                if header is not None:
+                    yield header, "".join(sequenceLines)
+                header = line[1:]
+                sequenceLines = []
+            else:
+                sequenceLines.append(line)
+        if header is not None:
+            yield header, "".join(sequenceLines)
+    finally:
+        if fastaFile is not sys.stdin:
+            fastaFile.close()
+
+
+def analyzeRecords(records):
+    """Analyze a list of (header, sequence) records.
+
+    Returns one row per record: [id, length, molecularWeight, count A, ..., count Y].
+    Used directly or as the task run by each worker process.
+    """
+    rows = []
+    for header, sequence in records:
+        aaCount, molecularWeight = analyzeSequence(sequence)
+        recordId = header.split(None, 1)[0] if header else ""
+        rows.append([recordId, len(sequence), round(molecularWeight, 2)]
+                    + [int(aaCount[aa]) for aa in aaWeights])
+    return rows
+
+
+def analyzeFasta(path, jobs=1, batchSize=256):
+    """Yield an analysis row (see analyzeRecords) for every record in a FASTA file, in file order.
+
+    Records are sent to jobs worker processes in batches of batchSize; only a
+    few batches per worker are in flight at once so memory stays bounded.
+    """
+    records = readFasta(path)
+    batches = iter(lambda: list(itertools.islice(records, batchSize)), [])
+    if jobs <= 1:
+        for batch in batches:
+            yield from analyzeRecords(batch)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = [executor.submit(analyzeRecords, batch) for batch in itertools.islice(batches, jobs * 2)]
+        while pending:
+            rows = pending.pop(0).result()
+            pending.extend(executor.submit(analyzeRecords, batch) for batch in itertools.islice(batches, 1))
+            yield from rows
+
+
+def writeFastaReport(path, outputPath="-", jobs=1):
+    """Write a CSV row per FASTA record and return (recordCount, residueCount)."""
+    outputFile = sys.stdout if outputPath == "-" else open(outputPath, "w", newline="")
+    try:
+        writer = csv.writer(outputFile)
+        writer.writerow(["id", "length", "molecularWeight"] + list(aaWeights))
+        recordCount = residueCount = 0
+        for row in analyzeFasta(path, jobs):
+            writer.writerow(row)
+            recordCount += 1
+            residueCount += row[1]
+    finally:
+        if outputFile is not sys.stdout:
+            outputFile.close()
+    return recordCount, residueCount
+
+
+def printInsulinReport():
+    # Printing "the sequence of human insulin" to console using successive print() commands:
+
+    print("The sequence of human preproinsulin:")
+
+    print(preproInsulin)
+
+    # Printing to console using concatenated strings inside the print function (one-liner):
+
+    print("The sequence of human insulin, chain a: " + aInsulin)
+
+    aaCountInsulin, molecularWeightInsulin = analyzeSequence(insulin)
+    print("The rough molecular weight of insulin: " +
+    str(molecularWeightInsulin))
+
+    molecularWeightInsulinActual = 5807.63
+    print("Error percentage: " + str(((molecularWeightInsulin - molecularWeightInsulinActual)/molecularWeightInsulinActual)*100))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Insulin analyzer. Without arguments, prints the human insulin report.")
+    parser.add_argument("--fasta", help="FASTA file (.gz allowed, - for stdin) to analyze record by record")
+    parser.add_argument("--find", nargs="+", metavar="PEPTIDE",
+                        help="print where each peptide occurs (in the --fasta records, or in preproinsulin)")
+    parser.add_argument("-o", "--output", default="-", help="CSV output file for --fasta (default: stdout)")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help=f"worker processes for --fasta (default: 1, this machine has {os.cpu_count()})")
+    args = parser.parse_args(argv)
+
+    if args.find:
+        if args.fasta is None:
+            sequences = {"preproinsulin": preproInsulin}
+        else:
+            sequences = {header.split(None, 1)[0] if header else "": sequence
+                         for header, sequence in readFasta(args.fasta)}
+        index = MotifIndex(sequences)
+        for peptide in args.find:
+            for name, position in index.find(peptide):
+                # positions are printed starting at 1, as in sequence databases
+                print(f"{peptide}\t{name}\t{position + 1}")
+        return
+
+    if args.fasta is None:
+        printInsulinReport()
+        return
+
+    startTime = time.perf_counter()
+    recordCount, residueCount = writeFastaReport(args.fasta, args.output, args.jobs)
+    elapsed = max(time.perf_counter() - startTime, 1e-9)
+    print(f"Analyzed {recordCount} records ({residueCount} residues) in {elapsed:.2f}s: "
+          f"{recordCount / elapsed:.0f} records/sec", file=sys.stderr)
+
 
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,17 @@
+import argparse
+import concurrent.futures
+import functools
+import glob
+import io
+import os
+import sys
+import tempfile
+import time
+
+englishAlphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+# number of characters read from a file or stdin at a time when streaming
+defaultChunkSize = 1024 * 1024
 
 # a function called getDoubleAlphabet that takes a string argument and concatenates, or combines, the given string with itself
 def getDoubleAlphabet(alphabet):
@@ -15,30 +29,51 @@ def getCipherKey():
     return shiftAmount
 
 
+# The translation table for a (cipherKey, alphabet) pair never changes, so it is
+# built once and cached. Encrypting a message is then a single str.translate()
+# pass over the whole buffer instead of a find() and a string concatenation per
+# character.
+@functools.lru_cache(maxsize=128)
+def getTranslationTable(cipherKey, alphabet):
+    """Build the translation table used by encryptMessage.
+
+    Every character of the alphabet is mapped to the character found
+    cipherKey positions after its first occurrence, exactly like the original
+    find()-and-index loop did. Characters whose shifted position falls outside
+    the alphabet are returned separately so encryptMessage can raise the same
+    IndexError the loop would have raised.
+    """
+    table = {}
+    outOfRange = set()
+    for currentCharacter in alphabet:
+        if ord(currentCharacter) in table or currentCharacter in outOfRange:
+            continue
+        newPosition = alphabet.find(currentCharacter) + cipherKey
+        if -len(alphabet) <= newPosition < len(alphabet):
+            table[ord(currentCharacter)] = alphabet[newPosition]
+        else:
+            outOfRange.add(currentCharacter)
+    return table, frozenset(outOfRange)
+
+
 def encryptMessage(message, cipherKey, alphabet):
 
     """_Take three arguments: the message, the cipherKey, and the alphabet.
-        Initialize variables.
-        Use a for loop to traverse each letter in the message.
-        For a specific letter, find the position.
-        For a specific letter, determine the new position given the cipher key.
-        If current letter is in the alphabet, append the new letter to the encrypted message.
-        If current letter is not in the alphabet, append the current letter.
+        Convert the message to upper case.
+        Look up (or build once) the translation table for the cipher key.
+        Letters in the alphabet are replaced by the letter cipherKey positions
+        further along; any other character is kept as it is.
     Returns:
-        Return the encrypted message after exhausting all the letters in the message.
+        Return the encrypted message, translated in a single pass.
     """
 
-    encryptedMessage = ""
-    uppercaseMessage = ""
     uppercaseMessage = message.upper()
-    for currentCharacter in uppercaseMessage:
-        position = alphabet.find(currentCharacter)
-        newPosition = position + int(cipherKey)
-        if currentCharacter in alphabet:
-            encryptedMessage = encryptedMessage + alphabet[newPosition]
-        else:
-            encryptedMessage = encryptedMessage + currentCharacter
-    return encryptedMessage
+    if not uppercaseMessage:
+        return uppercaseMessage
+    table, outOfRange = getTranslationTable(int(cipherKey), alphabet)
+    if outOfRange and not outOfRange.isdisjoint(uppercaseMessage):
+        raise IndexError("string index out of range")
+    return uppercaseMessage.translate(table)
 
 def decryptMessage(message, cipherKey, alphabet):
     decryptKey = -1 * int(cipherKey)
@@ -73,4 +108,259 @@ def runCaesarCipherProgram():
     myDecryptedMessage = decryptMessage(myEncryptedMessage, myCipherKey, myAlphabet2)
     print(f'Decypted Message: {myDecryptedMessage}')
 
-runCaesarCipherProgram()
+
+# Stream a file through encryptMessage/decryptMessage one fixed-size chunk at a
+# time. The cipher works character by character, so every chunk can be
+# translated on its own and memory use stays bounded by chunkSize no matter how
+# large the input is.
+def transformStream(inputStream, outputStream, cipherKey, alphabet, decrypt=False, chunkSize=defaultChunkSize):
+    """Encrypt (or decrypt) everything read from inputStream into outputStream.
+
+    Returns the number of characters processed.
+    """
+    transform = decryptMessage if decrypt else encryptMessage
+    charCount = 0
+    while True:
+        chunk = inputStream.read(chunkSize)
+        if not chunk:
+            break
+        outputStream.write(transform(chunk, cipherKey, alphabet))
+        charCount += len(chunk)
+    return charCount
+
+# open a path for streaming, "-" meaning stdin/stdout. newline="" keeps line
+# endings exactly as they are in the input.
+def openTextStream(path, mode, encoding):
+    if path == "-":
+        standardStream = sys.stdin if mode == "r" else sys.stdout
+        return io.TextIOWrapper(standardStream.buffer, encoding=encoding, newline="", write_through=True)
+    return open(path, mode, encoding=encoding, newline="")
+
+def transformFile(inputPath, outputPath, cipherKey, decrypt=False, chunkSize=defaultChunkSize, encoding="utf-8"):
+    alphabet = getDoubleAlphabet(englishAlphabet)
+    inputStream = openTextStream(inputPath, "r", encoding)
+    try:
+        outputStream = openTextStream(outputPath, "w", encoding)
+        try:
+            return transformStream(inputStream, outputStream, cipherKey, alphabet, decrypt, chunkSize)
+        finally:
+            if outputPath == "-":
+                outputStream.detach()
+            else:
+                outputStream.close()
+    finally:
+        if inputPath == "-":
+            inputStream.detach()
+        else:
+            inputStream.close()
+
+# the permissions open() would give a file written at path: those of the file
+# it replaces, or 0666 minus the umask for a new one (mkstemp uses 0600)
+def getNewFileMode(path):
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+# Batch mode: encrypt many files at once. Every file is streamed through
+# transformFile into a temporary file next to its destination and then renamed
+# into place, so an interrupted run never leaves a half-written output behind.
+def transformFileAtomically(task):
+    """Worker for the batch pool. task is (inputPath, outputPath, cipherKey, decrypt, encoding).
+
+    Returns (inputPath, sizeInBytes, errorMessage); errorMessage is None on success.
+    """
+    inputPath, outputPath, cipherKey, decrypt, encoding = task
+    outputDir = os.path.dirname(outputPath) or "."
+    tempPath = None
+    try:
+        os.makedirs(outputDir, exist_ok=True)
+        fileDescriptor, tempPath = tempfile.mkstemp(dir=outputDir, prefix=".caesar-", suffix=".tmp")
+        os.close(fileDescriptor)
+        transformFile(inputPath, tempPath, cipherKey, decrypt, encoding=encoding)
+        with open(tempPath, "rb") as tempFile:
+            os.fsync(tempFile.fileno())
+        os.chmod(tempPath, getNewFileMode(outputPath))
+        os.replace(tempPath, outputPath)
+        return inputPath, os.path.getsize(inputPath), None
+    except (OSError, UnicodeError) as error:
+        if tempPath is not None and os.path.exists(tempPath):
+            os.remove(tempPath)
+        return inputPath, 0, str(error)
+
+# the part of a glob pattern before the first wildcard, used as the root that
+# output paths are made relative to; a pattern without wildcards names a
+# single file, whose directory is the root
+def getGlobRoot(pattern):
+    rootParts = []
+    for part in pattern.split(os.sep):
+        if any(wildcard in part for wildcard in "*?["):
+            break
+        rootParts.append(part)
+    else:
+        return os.path.dirname(pattern) or "."
+    return os.sep.join(rootParts) or "."
+
+def findBatchFiles(source):
+    """Return (rootDir, files) for a directory (searched recursively) or a glob pattern."""
+    if os.path.isdir(source):
+        rootDir = source
+        files = [os.path.join(dirPath, fileName)
+                 for dirPath, _, fileNames in os.walk(source)
+                 for fileName in fileNames]
+    else:
+        rootDir = getGlobRoot(source)
+        files = [path for path in glob.glob(source, recursive=True) if os.path.isfile(path)]
+    return rootDir, sorted(files)
+
+def runBatch(source, outputDir, cipherKey, decrypt=False, jobs=None, encoding="utf-8"):
+    """Encrypt (or decrypt) every file matched by source into outputDir using a process pool.
+
+    Returns a summary dict with the file count, byte count, elapsed time and failures.
+    """
+    rootDir, files = findBatchFiles(source)
+    tasks = [(path, os.path.join(outputDir, os.path.relpath(path, rootDir)), cipherKey, decrypt, encoding)
+             for path in files]
+    jobs = jobs or os.cpu_count() or 1
+    startTime = time.perf_counter()
+    if jobs == 1 or len(tasks) < 2:
+        results = list(map(transformFileAtomically, tasks))
+    else:
+        # small files are handed to the workers in chunks to keep the
+        # inter-process overhead low
+        chunkSize = max(1, min(256, len(tasks) // (jobs * 4)))
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(transformFileAtomically, tasks, chunksize=chunkSize))
+    elapsed = time.perf_counter() - startTime
+    return {
+        "files": sum(1 for _, _, error in results if error is None),
+        "bytes": sum(size for _, size, _ in results),
+        "seconds": elapsed,
+        "failures": [(path, error) for path, _, error in results if error is not None],
+    }
+
+def printBatchReport(summary, decrypt=False):
+    elapsed = max(summary["seconds"], 1e-9)
+    megabytes = summary["bytes"] / (1024 * 1024)
+    action = "Decrypted" if decrypt else "Encrypted"
+    print(f'{action} {summary["files"]} files ({megabytes:.2f} MB) in {summary["seconds"]:.2f}s: '
+          f'{summary["files"] / elapsed:.1f} files/sec, {megabytes / elapsed:.2f} MB/sec')
+    for path, error in summary["failures"]:
+        print(f'Failed: {path}: {error}', file=sys.stderr)
+
+# Relative frequency (in percent) of each letter in English text, used to score
+# candidate keys when cracking a message.
+englishLetterFrequencies = {
+    'A': 8.167, 'B': 1.492, 'C': 2.782, 'D': 4.253, 'E': 12.702, 'F': 2.228,
+    'G': 2.015, 'H': 6.094, 'I': 6.966, 'J': 0.153, 'K': 0.772, 'L': 4.025,
+    'M': 2.406, 'N': 6.749, 'O': 7.507, 'P': 1.929, 'Q': 0.095, 'R': 5.987,
+    'S': 6.327, 'T': 9.056, 'U': 2.758, 'V': 0.978, 'W': 2.360, 'X': 0.150,
+    'Y': 1.974, 'Z': 0.074
+}
+
+# only this many characters of the ciphertext are looked at when cracking
+defaultSampleSize = 100000
+
+# Recover an unknown key without decrypting the message 25 times. Shifting the
+# text by a key only rotates its letter counts, so the letters are counted once
+# and every candidate key is scored against the English frequencies by
+# rotating that single count array.
+def crackCipherKey(encryptedMessage, sampleSize=defaultSampleSize):
+    """Rank the candidate keys 1-25 for an encrypted message.
+
+    Only the first sampleSize characters are used. Returns a list of
+    (cipherKey, chiSquared) tuples, most likely key first; lower chi-squared
+    means the decrypted letters look more like English.
+    """
+    sample = encryptedMessage[:sampleSize].upper()
+    letterCounts = [sample.count(letter) for letter in englishAlphabet]
+    letterTotal = sum(letterCounts)
+    expectedCounts = [englishLetterFrequencies[letter] / 100 * letterTotal for letter in englishAlphabet]
+    alphabetLength = len(englishAlphabet)
+    scores = []
+    for cipherKey in range(1, alphabetLength):
+        chiSquared = 0.0
+        for position, expected in enumerate(expectedCounts):
+            observed = letterCounts[(position + cipherKey) % alphabetLength]
+            chiSquared += (observed - expected) ** 2 / expected if expected else 0.0
+        scores.append((cipherKey, chiSquared))
+    scores.sort(key=lambda score: score[1])
+    return scores
+
+# argparse type for --key: the doubled alphabet only supports shifts from 1-25
+def cipherKeyArgument(value):
+    try:
+        cipherKey = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid key: {value!r}")
+    if not 1 <= cipherKey <= 25:
+        raise argparse.ArgumentTypeError("key must be a whole number from 1-25")
+    return cipherKey
+
+def positiveIntArgument(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("must be a positive whole number")
+    return number
+
+def buildArgumentParser():
+    parser = argparse.ArgumentParser(
+        description="Caesar cipher. Run without arguments for the interactive program.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command in ("encrypt", "decrypt"):
+        streamParser = subparsers.add_parser(command, help=f"{command} a file or stdin")
+        streamParser.add_argument("input", nargs="?", default="-", help="input file (default: stdin)")
+        streamParser.add_argument("-o", "--output", default="-", help="output file (default: stdout)")
+        streamParser.add_argument("-k", "--key", type=cipherKeyArgument, required=True, help="cipher key (1-25)")
+        streamParser.add_argument("--chunk-size", type=positiveIntArgument, default=defaultChunkSize,
+                                  help=f"characters per chunk (default: {defaultChunkSize})")
+        streamParser.add_argument("--encoding", default="utf-8", help="text encoding (default: utf-8)")
+    crackParser = subparsers.add_parser("crack", help="find the most likely key of an encrypted file or stdin")
+    crackParser.add_argument("input", nargs="?", default="-", help="encrypted file (default: stdin)")
+    crackParser.add_argument("--sample-size", type=positiveIntArgument, default=defaultSampleSize,
+                             help=f"characters of the input to score (default: {defaultSampleSize})")
+    crackParser.add_argument("--top", type=positiveIntArgument, default=5, help="number of keys to show (default: 5)")
+    crackParser.add_argument("--encoding", default="utf-8", help="text encoding (default: utf-8)")
+    batchParser = subparsers.add_parser("batch", help="encrypt or decrypt many files with a process pool")
+    batchParser.add_argument("source", help="directory (searched recursively) or glob pattern")
+    batchParser.add_argument("-o", "--output-dir", required=True, help="directory for the output files")
+    batchParser.add_argument("-k", "--key", type=cipherKeyArgument, required=True, help="cipher key (1-25)")
+    batchParser.add_argument("-d", "--decrypt", action="store_true", help="decrypt instead of encrypt")
+    batchParser.add_argument("-j", "--jobs", type=positiveIntArgument, default=None,
+                             help="worker processes (default: number of CPUs)")
+    batchParser.add_argument("--encoding", default="utf-8", help="text encoding (default: utf-8)")
+    return parser
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if not argv:
+        runCaesarCipherProgram()
+        return
+    args = buildArgumentParser().parse_args(argv)
+    if args.command in ("encrypt", "decrypt"):
+        transformFile(args.input, args.output, args.key, args.command == "decrypt",
+                      args.chunk_size, args.encoding)
+    elif args.command == "crack":
+        inputStream = openTextStream(args.input, "r", args.encoding)
+        try:
+            sample = inputStream.read(args.sample_size)
+        finally:
+            if args.input == "-":
+                inputStream.detach()
+            else:
+                inputStream.close()
+        alphabet = getDoubleAlphabet(englishAlphabet)
+        for rank, (cipherKey, chiSquared) in enumerate(crackCipherKey(sample, args.sample_size)[:args.top], start=1):
+            preview = decryptMessage(sample[:60], cipherKey, alphabet).replace("\n", " ")
+            print(f'{rank}. key {cipherKey:2d}  chi-squared {chiSquared:10.2f}  {preview}')
+    elif args.command == "batch":
+        summary = runBatch(args.source, args.output_dir, args.key, args.decrypt, args.jobs, args.encoding)
+        printBatchReport(summary, args.decrypt)
+        if summary["failures"]:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
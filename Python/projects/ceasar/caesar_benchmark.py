@@ -0,0 +1,159 @@
+# Benchmark for the Caesar cipher programs in this folder.
+#
+# caesar-cipher.py and the four debug lab versions each define their own
+# encryptMessage/decryptMessage. This script loads every version, runs its
+# encryptMessage over messages from 1 KB up to 100 MB and records the
+# throughput (characters per second), the peak memory used and whether the
+# output matches caesar-cipher.py. The results are written as JSON so runs can
+# be compared over time.
+#
+#   python caesar_benchmark.py
+#   python caesar_benchmark.py --sizes 1K,64K,1M --output results.json
+
+import argparse
+import ast
+import hashlib
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+import types
+
+projectDir = os.path.dirname(os.path.abspath(__file__))
+
+# the reference implementation comes first; the others are compared against it
+variantFiles = [
+    "caesar-cipher.py",
+    "debug-caesar-1.py",
+    "debug-caesar-2.py",
+    "caesar_debug-3.py",
+    "debug-caesar-4.py",
+]
+
+defaultSizes = "1K,10K,100K,1M,10M,100M"
+sizeUnits = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+def loadVariant(fileName):
+    """Load the functions of one cipher program without running it.
+
+    Every version ends with a bare runCaesarCipherProgram() call that would
+    wait for input(), so top-level call statements are removed from the
+    parsed source before it is executed.
+    """
+    path = os.path.join(projectDir, fileName)
+    with open(path, encoding="utf-8") as sourceFile:
+        tree = ast.parse(sourceFile.read(), filename=path)
+    tree.body = [node for node in tree.body
+                 if not (isinstance(node, ast.Expr) and isinstance(node.value, ast.Call))]
+    module = types.ModuleType(os.path.splitext(fileName)[0].replace("-", "_"))
+    module.__file__ = path
+    exec(compile(tree, path, "exec"), module.__dict__)
+    return module
+
+
+def parseSize(text):
+    text = text.strip().upper().rstrip("B")
+    if text[-1:] in sizeUnits:
+        return int(float(text[:-1]) * sizeUnits[text[-1]])
+    return int(text)
+
+
+def makeMessage(size, seed=0):
+    """Build a repeatable mixed-case message of size characters."""
+    generator = random.Random(seed)
+    characters = alphabet + alphabet.lower() + "      .,!?'\n0123456789"
+    block = "".join(generator.choice(characters) for _ in range(min(size, 65536)))
+    repeats, remainder = divmod(size, len(block))
+    return block * repeats + block[:remainder]
+
+
+def digest(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def measure(module, message, cipherKey, doubleAlphabet, trackMemory):
+    """Time one encryptMessage call and, if asked, measure its peak memory in a second run."""
+    startTime = time.perf_counter()
+    encrypted = module.encryptMessage(message, cipherKey, doubleAlphabet)
+    seconds = time.perf_counter() - startTime
+    peakMemory = None
+    if trackMemory:
+        # tracemalloc slows the code down, so memory is measured separately
+        # from the timed run
+        tracemalloc.start()
+        module.encryptMessage(message, cipherKey, doubleAlphabet)
+        peakMemory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    decrypted = module.decryptMessage(encrypted, cipherKey, doubleAlphabet)
+    return seconds, peakMemory, digest(encrypted), digest(decrypted)
+
+
+def runBenchmark(sizes, cipherKey=3, trackMemory=True, variants=variantFiles):
+    doubleAlphabet = alphabet + alphabet
+    modules = [(fileName, loadVariant(fileName)) for fileName in variants]
+    results = []
+    for size in sizes:
+        message = makeMessage(size)
+        referenceDigests = None
+        for fileName, module in modules:
+            seconds, peakMemory, encryptedDigest, decryptedDigest = measure(
+                module, message, cipherKey, doubleAlphabet, trackMemory)
+            if referenceDigests is None:
+                referenceDigests = (encryptedDigest, decryptedDigest)
+            result = {
+                "variant": fileName,
+                "size": size,
+                "seconds": seconds,
+                "charsPerSecond": size / seconds if seconds else None,
+                "peakMemoryBytes": peakMemory,
+                "matchesReference": (encryptedDigest, decryptedDigest) == referenceDigests,
+            }
+            results.append(result)
+            printResult(result)
+    return results
+
+
+def printResult(result):
+    speed = result["charsPerSecond"]
+    memory = result["peakMemoryBytes"]
+    print(f'{result["variant"]:<20} {result["size"]:>12,} chars  '
+          f'{speed if speed is None else f"{speed:,.0f}":>16} chars/sec  '
+          f'{"-" if memory is None else f"{memory / 1024 ** 2:,.1f} MB":>12} peak  '
+          f'{"same output" if result["matchesReference"] else "DIFFERENT OUTPUT"}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Caesar cipher programs in this folder.")
+    parser.add_argument("--sizes", default=defaultSizes,
+                        help=f"comma separated message sizes, K/M/G suffixes allowed (default: {defaultSizes})")
+    parser.add_argument("--key", type=int, default=3, help="cipher key to use (default: 3)")
+    parser.add_argument("--variants", default=",".join(variantFiles),
+                        help="comma separated files to benchmark, the first one is the reference")
+    parser.add_argument("--no-memory", action="store_true", help="skip the peak memory measurement")
+    parser.add_argument("--output", default="caesar-benchmark.json", help="JSON results file (default: caesar-benchmark.json)")
+    args = parser.parse_args(argv)
+
+    sizes = [parseSize(size) for size in args.sizes.split(",")]
+    variants = [variant.strip() for variant in args.variants.split(",")]
+    results = runBenchmark(sizes, args.key, not args.no_memory, variants)
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cipherKey": args.key,
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as outputFile:
+        json.dump(report, outputFile, indent=2)
+    print(f"Results written to {args.output}")
+    if not all(result["matchesReference"] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
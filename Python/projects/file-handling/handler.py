@@ -1,15 +1,26 @@
+import argparse
+import asyncio
+import csv
 import json
+import sys
+import time
+
+from user_server import UserClient, UserServer, parse_address
+from user_store import BatchError, UserStore
 
 filename = "file-handling/users.json"
-data = {}
 
+# users.json is only rewritten when the change log is compacted; every add,
+# remove and edit is appended to users.json.log (see user_store.py). Nothing is
+# read until the first lookup, and lookups go through the memory-mapped sorted
+# index users.json.idx instead of parsing users.json. Several copies of this
+# program can change the phone book at the same time without losing updates:
+# each check-and-change below is one batch, applied under a file lock.
 try:
-    with open(filename, 'r') as f:
-        data = json.load(f)
-        # print(data)
-
-except IOError:
+    data = UserStore(filename)
+except OSError:
     print("error! Cannot read the file...")
+    raise SystemExit(1)
 
 
 def check_user():
@@ -26,23 +37,21 @@ def add_user():
         print("The user already exists")
     else:
         num = input("Enter Phone: ")
-        user = {name : num}
-        data.update(user)
-        with open(filename, 'w') as fi:
-            json.dump(data, fi)
-        
+        try:
+            data.apply_batch([{"op": "add", "name": name, "phone": num}])
+        except BatchError:
+            print("The user already exists")  # added by someone else in the meantime
+            return
+
         print("User added successfully")
 
 def remove_user():
     name = input("Enter the name of the user to remove: ")
-    if name not in data:
+    try:
+        data.apply_batch([{"op": "remove", "name": name}])
+    except BatchError:
         print("The user does not exist")
     else:
-        keyToRemove = name
-        if keyToRemove in data:
-            del data[keyToRemove]
-        with open(filename, 'w') as fil:
-            json.dump(data, fil)
         print("User removed successfully")
 
 def edit_user():
@@ -51,39 +60,203 @@ def edit_user():
         print("The user does not exist")
     else:
         phoneOrName = input("Do you want to edit name or phone? (Name/Phone): ")
-        if phoneOrName == "Name":
-            oldName = name
-            newName = input("Enter new Name: ")
-            data[newName] = data.pop(oldName)
-
-            with open(filename, 'w') as fin:
-                json.dump(data, fin)
-            print("User name editted successfully!")
-        elif phoneOrName == "Phone":
-            keyToEdit = name
-            newPhone = input("Enter new Phone Number: ")
-            data[keyToEdit] = newPhone
-            with open(filename, 'w') as fin:
-                json.dump(data, fin)
-            print("Phone number editted successfully")
+        try:
+            if phoneOrName == "Name":
+                newName = input("Enter new Name: ")
+                data.apply_batch([{"op": "edit", "name": name, "new_name": newName}])
+                print("User name editted successfully!")
+            elif phoneOrName == "Phone":
+                newPhone = input("Enter new Phone Number: ")
+                data.apply_batch([{"op": "edit", "name": name, "phone": newPhone}])
+                print("Phone number editted successfully")
+            else:
+                print("Invalid input!")
+        except BatchError:
+            print("The user does not exist")  # removed by someone else in the meantime
+
+
+# Batch files are CSV (with a header row, e.g. "op,name,phone,new_name") or
+# JSON lines ({"op": "add", "name": ..., "phone": ...} per line). A missing op
+# means "add".
+def file_format(path, requested):
+    if requested:
+        return requested
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+
+def read_json_lines(inputFile):
+    number = 0
+    for lineNumber, line in enumerate(inputFile, start=1):
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as error:
+            raise BatchError(number, f"line {lineNumber} is not valid JSON ({error.msg})") from None
+        if not isinstance(row, dict):
+            raise BatchError(number, f"line {lineNumber} is not a JSON object")
+        yield row
+
+
+def read_operations(path, fmt):
+    inputFile = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+    try:
+        if fmt == "csv":
+            rows = csv.DictReader(inputFile)
+        else:
+            rows = read_json_lines(inputFile)
+        for row in rows:
+            operation = {key: value for key, value in row.items() if value not in (None, "")}
+            operation.setdefault("op", "add")
+            yield operation
+    finally:
+        if inputFile is not sys.stdin:
+            inputFile.close()
+
+
+def import_users(path, fmt=None):
+    startTime = time.perf_counter()
+    try:
+        count = data.apply_batch(read_operations(path, file_format(path, fmt)))
+    except BatchError as error:
+        print(f"Import failed, nothing was changed: {error}")
+        return False
+    elapsed = max(time.perf_counter() - startTime, 1e-9)
+    print(f"Imported {count} operations in {elapsed:.2f}s ({count / elapsed:.0f} operations/sec)")
+    return True
+
+
+def export_users(path, fmt=None):
+    fmt = file_format(path, fmt)
+    outputFile = sys.stdout if path == "-" else open(path, "w", newline="", encoding="utf-8")
+    try:
+        if fmt == "csv":
+            writer = csv.writer(outputFile)
+            writer.writerow(["name", "phone"])
+            writer.writerows(data.items())
         else:
-            print("Invalid input!")
+            for name, phone in data.items():
+                outputFile.write(json.dumps({"op": "add", "name": name, "phone": phone}) + "\n")
+    finally:
+        if outputFile is not sys.stdout:
+            outputFile.close()
+
+
+def search_users(text, mode="prefix", max_distance=2, limit=None):
+    if mode == "fuzzy":
+        for distance, name, phone in data.search_fuzzy(text, max_distance, limit):
+            print(f"{name}\t{phone}\t(distance {distance})")
+        return
+    if mode == "ignore-case":
+        matches = data.search_ignore_case(text)[:limit]
+    else:
+        matches = data.search_prefix(text, limit=limit)
+    for name, phone in matches:
+        print(f"{name}\t{phone}")
 
 
-inp = input("Do you want to add, check, edit, or remove a user? (Add, Check, Edit, Remove): ")
+def serve(address):
+    server = UserServer(data)
+    started = lambda address: print(f"Phone book server listening on {address[0]}:{address[1]}")
+    try:
+        asyncio.run(server.serve(*address, started))
+    except KeyboardInterrupt:
+        pass
 
-if inp == "Add":
-    add_user()
-elif inp == "Check":
-    check_user()
-elif inp == "Remove":
-    remove_user()
-elif inp == "Edit":
-    edit_user()
-else:
-    print("Invalid Input!!")
 
+def run_command(argv):
+    """Run one non-interactive command and return the exit code."""
+    global data
+    parser = argparse.ArgumentParser(description="Phone book. Run without arguments for the interactive prompt.")
+    parser.add_argument("--server", metavar="HOST:PORT",
+                        help="send the command to a phone book server instead of using the files directly")
+    commands = parser.add_subparsers(dest="command", required=True)
+    checkParser = commands.add_parser("check", help="check whether a user exists")
+    checkParser.add_argument("name")
+    addParser = commands.add_parser("add", help="add a user")
+    addParser.add_argument("name")
+    addParser.add_argument("phone")
+    removeParser = commands.add_parser("remove", help="remove a user")
+    removeParser.add_argument("name")
+    removeParser.add_argument("--expect", metavar="PHONE", help="only remove the user if this is their phone number")
+    editParser = commands.add_parser("edit", help="change a user's name and/or phone")
+    editParser.add_argument("name")
+    editParser.add_argument("--new-name")
+    editParser.add_argument("--phone")
+    editParser.add_argument("--expect", metavar="PHONE", help="only edit the user if this is their phone number")
+    for command, helpText in (("import", "apply add/set/remove/edit operations from a file as one transaction"),
+                              ("export", "write every user to a file")):
+        fileParser = commands.add_parser(command, help=helpText)
+        fileParser.add_argument("file", help="CSV or JSON lines file, - for stdin/stdout")
+        fileParser.add_argument("--format", choices=("csv", "jsonl"),
+                                help="file format (default: from the file extension, jsonl otherwise)")
+    searchParser = commands.add_parser("search", help="find users by name prefix, ignoring case, or by similar spelling")
+    searchParser.add_argument("text")
+    searchParser.add_argument("--mode", choices=("prefix", "ignore-case", "fuzzy"), default="prefix",
+                              help="prefix (default, case-insensitive), ignore-case (whole name) or fuzzy")
+    searchParser.add_argument("--max-distance", type=int, default=2,
+                              help="most letters that may differ in fuzzy mode (default: 2)")
+    searchParser.add_argument("--limit", type=int, help="print at most this many users")
+    serveParser = commands.add_parser("serve", help="serve the phone book to many clients at once")
+    serveParser.add_argument("address", nargs="?", default="127.0.0.1:8765", metavar="HOST:PORT",
+                             help="address to listen on (default: 127.0.0.1:8765)")
+    args = parser.parse_args(argv)
 
+    if args.command == "serve":
+        serve(parse_address(args.address))
+        return 0
+    if args.server:
+        data.close()
+        data = UserClient(parse_address(args.server))
 
+    if args.command == "check":
+        found = args.name in data
+        print("User is in the database" if found else "The user entered is not in the database")
+        return 0 if found else 1
+    if args.command == "import":
+        return 0 if import_users(args.file, args.format) else 1
+    if args.command == "export":
+        export_users(args.file, args.format)
+        return 0
+    if args.command == "search":
+        search_users(args.text, args.mode, args.max_distance, args.limit)
+        return 0
 
+    if args.command == "add":
+        operation = {"op": "add", "name": args.name, "phone": args.phone}
+    elif args.command == "remove":
+        operation = {"op": "remove", "name": args.name}
+    else:
+        operation = {"op": "edit", "name": args.name, "new_name": args.new_name, "phone": args.phone}
+    if getattr(args, "expect", None) is not None:
+        operation["expect"] = args.expect
+    try:
+        data.apply_batch([operation])
+    except BatchError as error:
+        print(error)
+        return 1
+    print("Done")
+    return 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        exitCode = run_command(sys.argv[1:])
+        data.close()
+        sys.exit(exitCode)
+
+    inp = input("Do you want to add, check, edit, or remove a user? (Add, Check, Edit, Remove): ")
+
+    if inp == "Add":
+        add_user()
+    elif inp == "Check":
+        check_user()
+    elif inp == "Remove":
+        remove_user()
+    elif inp == "Edit":
+        edit_user()
+    else:
+        print("Invalid Input!!")
 
+    data.close()
@@ -0,0 +1,171 @@
+import asyncio
+import json
+import socket
+
+from user_store import BatchError
+
+# Phone book server for handler.py.
+#
+# Many clients can send commands over TCP at once. The protocol is one JSON
+# object per line in each direction: {"method": ..., "args": [...]} is answered
+# by {"result": ...} or {"error": ..., "message": ...}.
+#
+# Every change is an "apply_batch" call. The server collects the batches of
+# all clients that arrived in the same pass of its event loop and writes them
+# with one append and one fsync (group commit). The more clients are writing,
+# the more batches share each fsync, so throughput grows with the number of
+# clients. A client only gets
+# its answer once its batch is on disk, and reads are served from the same
+# store, so a client always sees its own writes.
+
+READ_METHODS = {"contains", "len", "get", "items", "search_prefix", "search_ignore_case", "search_fuzzy"}
+
+
+def parse_address(text):
+    """Turn "host:port" (or just "port") into a (host, port) tuple."""
+    host, _, port = text.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+class UserServer:
+    """Serves a UserStore to many clients from a single asyncio event loop.
+
+    Only the event loop touches the store, so no thread locks are needed.
+    Writes are not applied as they arrive: they are collected and committed
+    together once the loop has handled every request that was ready.
+    """
+
+    def __init__(self, store, max_batches=1000):
+        """max_batches: most client batches written together with one fsync."""
+        self.store = store
+        self.max_batches = max_batches
+        self.pending = []  # (operations, future) waiting for the next commit
+        self.commit_scheduled = False
+
+    def read(self, method, args):
+        if method == "contains":
+            return args[0] in self.store
+        if method == "len":
+            return len(self.store)
+        if method == "items":
+            return list(self.store.items())
+        return getattr(self.store, method)(*args)
+
+    def write(self, operations):
+        """Return a future with the result of apply_batches() for this batch once it is on disk."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((operations, future))
+        if not self.commit_scheduled:
+            # call_soon runs after the callbacks that are already ready, so
+            # every request read in this pass of the loop joins the commit
+            self.commit_scheduled = True
+            loop.call_soon(self._commit)
+        return future
+
+    def _commit(self):
+        self.commit_scheduled = False
+        entries, self.pending = self.pending[:self.max_batches], self.pending[self.max_batches:]
+        if self.pending:
+            self.commit_scheduled = True
+            asyncio.get_running_loop().call_soon(self._commit)
+        try:
+            results = self.store.apply_batches([operations for operations, _ in entries])
+        except Exception as error:  # e.g. the disk is full: every waiting client gets the error
+            results = [error] * len(entries)
+        for (_, future), result in zip(entries, results):
+            if not future.cancelled():
+                future.set_result(result)
+
+    async def handle_client(self, reader, writer):
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                    method, args = request["method"], request.get("args", [])
+                    if method == "apply_batch":
+                        result = await self.write(args[0])
+                    elif method in READ_METHODS:
+                        result = self.read(method, args)
+                    else:
+                        raise ValueError(f"unknown method {method!r}")
+                    if isinstance(result, BatchError):
+                        response = {"error": "BatchError", "number": result.number, "message": result.message}
+                    elif isinstance(result, Exception):
+                        raise result
+                    else:
+                        response = {"result": result}
+                except Exception as error:
+                    response = {"error": type(error).__name__, "message": str(error)}
+                writer.write((json.dumps(response) + "\n").encode("utf-8"))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port, started=None):
+        """Accept clients until cancelled; started(address) is called once listening."""
+        server = await asyncio.start_server(self.handle_client, host, port, limit=1 << 24)
+        async with server:
+            if started is not None:
+                started(server.sockets[0].getsockname()[:2])
+            await server.serve_forever()
+
+
+class UserClient:
+    """Connection to a UserServer with the UserStore methods that handler.py uses."""
+
+    def __init__(self, address):
+        self.socket = socket.create_connection(address)
+        self.file = self.socket.makefile("rwb")
+
+    def _call(self, method, *args):
+        self.file.write((json.dumps({"method": method, "args": args}) + "\n").encode("utf-8"))
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("the phone book server closed the connection")
+        response = json.loads(line)
+        if "error" in response:
+            if response["error"] == "BatchError":
+                raise BatchError(response["number"], response["message"])
+            raise RuntimeError(f"{response['error']}: {response['message']}")
+        return response["result"]
+
+    def __contains__(self, name):
+        return self._call("contains", name)
+
+    def __len__(self):
+        return self._call("len")
+
+    def get(self, name, default=None):
+        return self._call("get", name, default)
+
+    def items(self):
+        return [tuple(item) for item in self._call("items")]
+
+    def search_prefix(self, prefix, ignore_case=True, limit=None):
+        return [tuple(item) for item in self._call("search_prefix", prefix, ignore_case, limit)]
+
+    def search_ignore_case(self, name):
+        return [tuple(item) for item in self._call("search_ignore_case", name)]
+
+    def search_fuzzy(self, name, max_distance=2, limit=None):
+        return [tuple(item) for item in self._call("search_fuzzy", name, max_distance, limit)]
+
+    def apply_batch(self, operations):
+        return self._call("apply_batch", list(operations))
+
+    def set(self, name, phone):
+        self.apply_batch([{"op": "set", "name": name, "phone": phone}])
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
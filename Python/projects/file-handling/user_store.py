@@ -0,0 +1,657 @@
+import array
+import contextlib
+import heapq
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from json.encoder import encode_basestring_ascii
+
+try:
+    import fcntl
+except ImportError:  # Windows: no locking between processes
+    fcntl = None
+
+# Storage engine for the phone book used by handler.py.
+#
+# users.json holds a snapshot of the phone book ({"name": "phone", ...}).
+# Every change is appended as one JSON line to users.json.log instead of
+# rewriting the whole snapshot, so a write costs O(1) no matter how many users
+# there are. When the log gets as long as the phone book it is compacted: a
+# new snapshot is written to a temporary file and renamed over users.json, and
+# the log is replaced by an empty one.
+#
+# Log records are {"op": "set", "name": ..., "phone": ...} and
+# {"op": "del", "name": ...}. Replaying them in order always gives the same
+# result, even on top of a snapshot that already contains some of them, so a
+# crash between the two renames of a compaction loses nothing.
+#
+# The snapshot is not parsed on every start. Next to it, users.json.idx holds
+# the same users sorted by case-folded name in a binary file that is
+# memory-mapped, so a lookup is a binary search that only touches a few
+# pages, and prefix, case-insensitive and fuzzy searches need no full scan.
+# Only the (short) log is read into memory, and nothing at all is read until
+# the phone book is first used. The index records the size and modification
+# time of the snapshot it was built from and is rebuilt if they change.
+#
+# Several processes can share the files. Writers take an exclusive flock() on
+# users.json.lock, catch up with the log (or reload, if another process
+# compacted in the meantime), check their changes against that up-to-date
+# state and only then append, so no update is ever lost or applied on top of
+# a stale read. Readers take a shared lock and also catch up first, so a read
+# always sees every write that finished before it.
+
+# users.json.idx layout: header, then for every user (in sorted order) a record
+# of <key length: uint32><key: utf-8 case-folded name><JSON [name, phone]>,
+# then a uint64 offset per record (plus one for the end of the last record).
+INDEX_MAGIC = b"USERIDX1"
+INDEX_HEADER = struct.Struct("<8sQQQQ")  # magic, count, snapshot size, snapshot mtime_ns, offsets position
+KEY_LENGTH = struct.Struct("<I")
+
+_MISSING = object()
+
+
+def name_key(name):
+    """Sort key of a name: case-folded, ties broken by the exact name."""
+    return name.casefold(), name
+
+
+def temp_path_for(path):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                     prefix=".users-", suffix=".tmp")
+    os.close(fd)
+    return temp_path
+
+
+def replace_file(temp_path, path):
+    """Rename temp_path over path, keeping the permissions of the file being replaced."""
+    if os.path.exists(path):
+        os.chmod(temp_path, os.stat(path).st_mode & 0o7777)
+    os.replace(temp_path, path)
+
+
+def atomic_write(path, write):
+    """Call write(file) on a temporary file and rename it over path once it is safely on disk."""
+    temp_path = temp_path_for(path)
+    try:
+        with open(temp_path, "w", encoding="utf-8") as temp_file:
+            write(temp_file)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        replace_file(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def snapshot_fingerprint(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return 0, 0
+    return stat.st_size, stat.st_mtime_ns
+
+
+def edit_distance_row(previous_row, character, text):
+    """Next row of the Levenshtein table after character is appended to the other string."""
+    row = [previous_row[0] + 1]
+    for position, text_character in enumerate(text, start=1):
+        row.append(min(row[position - 1] + 1,
+                       previous_row[position] + 1,
+                       previous_row[position - 1] + (text_character != character)))
+    return row
+
+
+def edit_distance(first, second):
+    row = list(range(len(second) + 1))
+    for character in first:
+        row = edit_distance_row(row, character, second)
+    return row[-1]
+
+
+class IndexWriter:
+    """Writes users.json.idx; add() must be called in name_key order."""
+
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.file.write(INDEX_HEADER.pack(INDEX_MAGIC, 0, 0, 0, 0))
+        self.offsets = array.array("Q")
+        self.position = INDEX_HEADER.size
+
+    def add(self, name, phone):
+        key = name.casefold().encode("utf-8")
+        if isinstance(phone, str):
+            # same output as json.dumps([name, phone]) without its per-call overhead
+            entry = f"[{encode_basestring_ascii(name)}, {encode_basestring_ascii(phone)}]"
+        else:
+            entry = json.dumps([name, phone])
+        record = KEY_LENGTH.pack(len(key)) + key + entry.encode("ascii")
+        self.offsets.append(self.position)
+        self.file.write(record)
+        self.position += len(record)
+
+    def finish(self, fingerprint):
+        """Write the offsets and the header for the snapshot with the given (size, mtime_ns)."""
+        count = len(self.offsets)
+        self.offsets.append(self.position)
+        if sys.byteorder == "big":
+            self.offsets.byteswap()  # the file is always little-endian
+        self.file.write(self.offsets.tobytes())
+        self.file.seek(0)
+        self.file.write(INDEX_HEADER.pack(INDEX_MAGIC, count, fingerprint[0], fingerprint[1], self.position))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+
+class SortedIndex:
+    """Read-only, memory-mapped view of users.json.idx."""
+
+    def __init__(self, path):
+        with open(path, "rb") as index_file:
+            self.mmap = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, self.count, size, mtime_ns, self.offsets_position = INDEX_HEADER.unpack_from(self.mmap)
+        except struct.error:
+            magic = None
+        if magic != INDEX_MAGIC:
+            self.mmap.close()
+            raise ValueError(f"{path} is not a phone book index")
+        self.fingerprint = (size, mtime_ns)
+
+    def __len__(self):
+        return self.count
+
+    def _record(self, index):
+        """(start, end) byte offsets of the record at index."""
+        return struct.unpack_from("<QQ", self.mmap, self.offsets_position + 8 * index)
+
+    def key(self, index):
+        start, _ = self._record(index)
+        (key_length,) = KEY_LENGTH.unpack_from(self.mmap, start)
+        return self.mmap[start + 4:start + 4 + key_length].decode("utf-8")
+
+    def entry(self, index):
+        """Return (name, phone) of the record at index."""
+        start, end = self._record(index)
+        (key_length,) = KEY_LENGTH.unpack_from(self.mmap, start)
+        name, phone = json.loads(self.mmap[start + 4 + key_length:end])
+        return name, phone
+
+    def bisect_key(self, key):
+        """First index whose case-folded key is >= key."""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def prefix_range(self, key_prefix):
+        """(first, last) indexes of the records whose key starts with key_prefix."""
+        return self.bisect_key(key_prefix), self.bisect_key(key_prefix + "\U0010ffff")
+
+    def get(self, name, default=None):
+        key = name.casefold()
+        index = self.bisect_key(key)
+        while index < self.count and self.key(index) == key:
+            entry_name, phone = self.entry(index)
+            if entry_name == name:
+                return phone
+            index += 1
+        return default
+
+    def close(self):
+        self.mmap.close()
+
+
+class BatchError(ValueError):
+    """A batch operation could not be applied; nothing from the batch was written."""
+
+    def __init__(self, number, message):
+        super().__init__(f"operation {number}: {message}")
+        self.number = number
+        self.message = message
+
+
+class UserStore:
+    """Phone book of name -> phone number with O(1) appends and periodic compaction.
+
+    Several processes may use the same files at once: every call takes a lock
+    on users.json.lock (shared for reads, exclusive for writes) and first
+    catches up with whatever the other processes have written. A UserStore
+    object itself must only be used by one thread at a time.
+    """
+
+    def __init__(self, path, compact_threshold=10000, durable=True):
+        """
+        path: the snapshot file (users.json); the log is path + ".log", the index
+            path + ".idx" and the lock file path + ".lock".
+        compact_threshold: the log is never compacted before it has this many records.
+        durable: fsync the log after every write so an acknowledged change survives a crash.
+
+        Nothing is read until the phone book is first used, but the lock file
+        is opened (created) here, so a missing or read-only directory raises
+        OSError right away.
+        """
+        self.path = path
+        self.log_path = path + ".log"
+        self.index_path = path + ".idx"
+        self.lock_path = path + ".lock"
+        self.compact_threshold = compact_threshold
+        self.durable = durable
+        self.index = None
+        self.changes = None  # name -> phone (or _MISSING if deleted) from the log
+        self.count = 0
+        self.log_records = 0
+        self.log_file = None
+        self.log_identity = None  # (device, inode) of the log that was read
+        self.log_offset = 0  # bytes of the log that have been read
+        self.lock_file = open(self.lock_path, "a")
+
+    @contextlib.contextmanager
+    def _locked(self, exclusive=False):
+        """Hold the lock file and bring the in-memory state up to date with the files."""
+        if self.lock_file is None:
+            self.lock_file = open(self.lock_path, "a")
+        if fcntl is not None:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            self._refresh(exclusive)
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+
+    def _refresh(self, exclusive):
+        """Read the records other processes appended, or reload everything if they compacted."""
+        try:
+            stat = os.stat(self.log_path)
+            log_identity = (stat.st_dev, stat.st_ino)
+        except FileNotFoundError:
+            log_identity = None
+        if (self.index is None or log_identity != self.log_identity
+                or self.index.fingerprint != snapshot_fingerprint(self.path)):
+            self._load(exclusive)
+        elif stat.st_size > self.log_offset:
+            self._read_log(exclusive)
+
+    def _open_index(self):
+        """Map users.json.idx, rebuilding it first if it does not match users.json."""
+        try:
+            index = SortedIndex(self.index_path)
+            if index.fingerprint == snapshot_fingerprint(self.path):
+                return index
+            index.close()
+        except (FileNotFoundError, ValueError):
+            pass
+        try:
+            with open(self.path, encoding="utf-8") as snapshot:
+                users = json.load(snapshot)
+        except FileNotFoundError:
+            users = {}
+        temp_path = temp_path_for(self.index_path)
+        writer = IndexWriter(temp_path)
+        for name in sorted(users, key=name_key):
+            writer.add(name, users[name])
+        writer.finish(snapshot_fingerprint(self.path))
+        os.replace(temp_path, self.index_path)
+        return SortedIndex(self.index_path)
+
+    def _load(self, exclusive):
+        # The previous index is not closed here: an items() iterator may still
+        # be reading it. Its map is released once nothing refers to it.
+        self.index = self._open_index()
+        self.changes = {}
+        self.count = len(self.index)
+        self.log_records = 0
+        if self.log_file is not None:
+            self.log_file.close()
+        self.log_file = open(self.log_path, "ab")
+        stat = os.fstat(self.log_file.fileno())
+        self.log_identity = (stat.st_dev, stat.st_ino)
+        self.log_offset = 0
+        self._read_log(exclusive)
+
+    def _read_log(self, exclusive):
+        """Apply the log records after log_offset."""
+        with open(self.log_path, "rb") as log_file:
+            log_file.seek(self.log_offset)
+            for line in log_file:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                self._apply(record)
+                self.log_records += 1
+                self.log_offset += len(line)
+        # Writers hold the exclusive lock, so anything left over is a torn last
+        # line from a crash mid-write. It is dropped before appending after it.
+        if exclusive and self.log_offset < os.path.getsize(self.log_path):
+            os.truncate(self.log_path, self.log_offset)
+
+    def _lookup(self, name):
+        phone = self.changes.get(name)
+        if phone is None:
+            phone = self.index.get(name, _MISSING)
+        return phone
+
+    def _apply(self, record):
+        name = record["name"]
+        existed = self._lookup(name) is not _MISSING
+        if record["op"] == "set":
+            self.changes[name] = record["phone"]
+            self.count += not existed
+        elif record["op"] == "del":
+            self.changes[name] = _MISSING
+            self.count -= existed
+
+    def _append(self, records):
+        data = "".join(json.dumps(record) + "\n" for record in records).encode("utf-8")
+        self.log_file.write(data)
+        self.log_file.flush()
+        if self.durable:
+            os.fsync(self.log_file.fileno())
+        for record in records:
+            self._apply(record)
+        self.log_records += len(records)
+        self.log_offset += len(data)
+        if self.log_records > max(self.compact_threshold, self.count):
+            self._compact()
+
+    def __contains__(self, name):
+        with self._locked():
+            return self._lookup(name) is not _MISSING
+
+    def __len__(self):
+        with self._locked():
+            return self.count
+
+    def get(self, name, default=None):
+        with self._locked():
+            phone = self._lookup(name)
+        return default if phone is _MISSING else phone
+
+    def set(self, name, phone):
+        """Add a user or change their phone number."""
+        with self._locked(exclusive=True):
+            self._append([{"op": "set", "name": name, "phone": phone}])
+
+    def delete(self, name):
+        with self._locked(exclusive=True):
+            if self._lookup(name) is _MISSING:
+                raise KeyError(name)
+            self._append([{"op": "del", "name": name}])
+
+    def rename(self, old_name, new_name):
+        """Move a user's phone number to a new name (replacing any user already called new_name)."""
+        with self._locked(exclusive=True):
+            phone = self._lookup(old_name)
+            if phone is _MISSING:
+                raise KeyError(old_name)
+            self._append([{"op": "del", "name": old_name},
+                          {"op": "set", "name": new_name, "phone": phone}])
+
+    def apply_batch(self, operations):
+        """Apply a list of operations as one transaction and return how many were applied.
+
+        Each operation is a dict with an "op" key:
+          {"op": "add", "name": ..., "phone": ...}     new user, must not exist
+          {"op": "set", "name": ..., "phone": ...}     add or overwrite a user
+          {"op": "remove", "name": ...}                user must exist
+          {"op": "edit", "name": ..., "phone": ..., "new_name": ...}
+                                                       user must exist; phone and/or new_name
+        Any operation may also have an "expect" key: it is then only applied
+        if the user's current phone number is exactly that (compare-and-swap),
+        so a client can make sure nobody changed the user since it read them.
+
+        Operations are checked in order against the result of the ones before
+        them, with the lock held, so they see every change made by other
+        processes. If any of them fails a BatchError is raised and nothing is
+        written; otherwise the whole batch is written with a single append
+        (or a single snapshot, if the batch is bigger than the phone book).
+        """
+        result = self.apply_batches([operations])[0]
+        if isinstance(result, BatchError):
+            raise result
+        return result
+
+    def apply_batches(self, batches):
+        """Apply several independent batches with a single append and fsync (group commit).
+
+        Each batch is a transaction as in apply_batch() and sees the batches
+        before it. Returns a list with, for each batch, the number of operations
+        applied or the BatchError that rejected it (a rejected batch does not
+        affect the others).
+        """
+        with self._locked(exclusive=True):
+            staged = {}  # name -> phone (or _MISSING) for names changed by the accepted batches
+            records = []
+            results = []
+            for operations in batches:
+                try:
+                    batch_records, batch_staged, count = self._stage(operations, staged)
+                except BatchError as error:
+                    results.append(error)
+                    continue
+                staged.update(batch_staged)
+                records.extend(batch_records)
+                results.append(count)
+
+            if len(records) > max(self.compact_threshold, self.count):
+                # cheaper to write one new snapshot than to log every record
+                for record in records:
+                    self._apply(record)
+                self._compact()
+            elif records:
+                self._append(records)
+        return results
+
+    def _stage(self, operations, staged):
+        """Check one batch on top of staged; return (log records, its changes, operation count)."""
+        changes = {}
+
+        def lookup(name):
+            for layer in (changes, staged):
+                phone = layer.get(name)
+                if phone is not None:
+                    return phone
+            return self._lookup(name)
+
+        records = []
+        number = 0
+        try:
+            operations = iter(operations)
+        except TypeError:
+            raise BatchError(number, "a batch must be a list of operations") from None
+        for number, operation in enumerate(operations, start=1):
+            # batches may come from other programs (user_server.py): check
+            # their shape here, so a bad one is rejected like any other batch
+            if not isinstance(operation, dict):
+                raise BatchError(number, "an operation must be an object")
+            op = operation.get("op")
+            name = operation.get("name")
+            phone = operation.get("phone")
+            if not name:
+                raise BatchError(number, "missing name")
+            for key in ("name", "phone", "new_name", "expect"):
+                if operation.get(key) is not None and not isinstance(operation[key], str):
+                    raise BatchError(number, f"{key} must be a string")
+            current = lookup(name)
+            exists = current is not _MISSING
+            if "expect" in operation and (not exists or current != operation["expect"]):
+                found = f"{current!r}" if exists else "missing"
+                raise BatchError(number, f"phone of {name!r} is {found}, expected {operation['expect']!r}")
+            if op in ("add", "set"):
+                if op == "add" and exists:
+                    raise BatchError(number, f"user {name!r} already exists")
+                if phone is None:
+                    raise BatchError(number, f"missing phone for {name!r}")
+                records.append({"op": "set", "name": name, "phone": phone})
+                changes[name] = phone
+            elif op == "remove":
+                if not exists:
+                    raise BatchError(number, f"user {name!r} does not exist")
+                records.append({"op": "del", "name": name})
+                changes[name] = _MISSING
+            elif op == "edit":
+                if not exists:
+                    raise BatchError(number, f"user {name!r} does not exist")
+                new_name = operation.get("new_name") or name
+                new_phone = phone if phone is not None else current
+                if new_name != name:
+                    records.append({"op": "del", "name": name})
+                    changes[name] = _MISSING
+                records.append({"op": "set", "name": new_name, "phone": new_phone})
+                changes[new_name] = new_phone
+            else:
+                raise BatchError(number, f"unknown op {op!r}")
+        return records, changes, number
+
+    def _changed_items(self, changes, key_prefix=None):
+        """Sorted (name_key, name, phone) of the users set by the log, optionally only those with a key prefix."""
+        items = []
+        for name, phone in changes.items():
+            if phone is not _MISSING and (key_prefix is None or name.casefold().startswith(key_prefix)):
+                items.append((name_key(name), name, phone))
+        items.sort()
+        return items
+
+    def _index_items(self, index, changes, first=0, last=None):
+        """(name_key, name, phone) of the indexed users not overridden by the log."""
+        if last is None:
+            last = len(index)
+        for position in range(first, last):
+            name, phone = index.entry(position)
+            if name not in changes:
+                yield name_key(name), name, phone
+
+    def items(self):
+        """Yield (name, phone) for every user, sorted by case-insensitive name.
+
+        The users are those present when the iteration starts; changes made
+        while iterating are not seen.
+        """
+        with self._locked():
+            index, changes = self.index, dict(self.changes)
+        for _, name, phone in heapq.merge(self._index_items(index, changes), self._changed_items(changes)):
+            yield name, phone
+
+    def search_prefix(self, prefix, ignore_case=True, limit=None):
+        """Return [(name, phone), ...] of the users whose name starts with prefix, sorted by name."""
+        key_prefix = prefix.casefold()
+        results = []
+        with self._locked():
+            first, last = self.index.prefix_range(key_prefix)
+            for _, name, phone in heapq.merge(self._index_items(self.index, self.changes, first, last),
+                                              self._changed_items(self.changes, key_prefix)):
+                if ignore_case or name.startswith(prefix):
+                    results.append((name, phone))
+                    if limit is not None and len(results) >= limit:
+                        break
+        return results
+
+    def search_ignore_case(self, name):
+        """Return [(name, phone), ...] of the users whose name equals name, ignoring case."""
+        key = name.casefold()
+        return [(found, phone) for found, phone in self.search_prefix(name)
+                if found.casefold() == key]
+
+    def search_fuzzy(self, name, max_distance=2, limit=None):
+        """Return [(distance, name, phone), ...] of the users within max_distance edits of name, ignoring case.
+
+        The sorted index is walked like a trie: the edit-distance rows of a
+        shared prefix are reused, and once a whole row is above max_distance
+        every name starting with that prefix is skipped with a binary search.
+        """
+        with self._locked():
+            return self._search_fuzzy(name.casefold(), max_distance, limit)
+
+    def _search_fuzzy(self, query, max_distance, limit):
+        matches = []
+        rows = [list(range(len(query) + 1))]
+        previous_key = ""
+        index, count = 0, len(self.index)
+        while index < count:
+            key = self.index.key(index)
+            common = 0
+            while (common < min(len(previous_key), len(key), len(rows) - 1)
+                   and previous_key[common] == key[common]):
+                common += 1
+            del rows[common + 1:]
+            pruned = False
+            for depth in range(common, len(key)):
+                rows.append(edit_distance_row(rows[-1], key[depth], query))
+                if min(rows[-1]) > max_distance:
+                    # no name starting with key[:depth + 1] can be close enough
+                    index = self.index.prefix_range(key[:depth + 1])[1]
+                    pruned = True
+                    break
+            previous_key = key[:len(rows) - 1]
+            if pruned:
+                continue
+            distance = rows[-1][-1]
+            if distance <= max_distance:
+                found, phone = self.index.entry(index)
+                if found not in self.changes:
+                    matches.append((distance, name_key(found), found, phone))
+            index += 1
+
+        for key, found, phone in self._changed_items(self.changes):
+            distance = edit_distance(key[0], query)
+            if distance <= max_distance:
+                matches.append((distance, key, found, phone))
+        matches.sort()
+        return [(distance, found, phone) for distance, _, found, phone in matches[:limit]]
+
+    def compact(self):
+        """Write the current phone book as the new snapshot and index, and start an empty log."""
+        with self._locked(exclusive=True):
+            self._compact()
+
+    def _compact(self):
+        snapshot_temp = temp_path_for(self.path)
+        index_temp = temp_path_for(self.index_path)
+        try:
+            writer = IndexWriter(index_temp)
+            with open(snapshot_temp, "w", encoding="utf-8") as snapshot:
+                snapshot.write("{")
+                separator = ""
+                for _, name, phone in heapq.merge(self._index_items(self.index, self.changes),
+                                                  self._changed_items(self.changes)):
+                    snapshot.write(f"{separator}{json.dumps(name)}: {json.dumps(phone)}")
+                    separator = ", "
+                    writer.add(name, phone)
+                snapshot.write("}")
+                snapshot.flush()
+                os.fsync(snapshot.fileno())
+            replace_file(snapshot_temp, self.path)
+            writer.finish(snapshot_fingerprint(self.path))
+            os.replace(index_temp, self.index_path)
+        finally:
+            for temp_path in (snapshot_temp, index_temp):
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+        # a new log file, so other processes notice the compaction and reload
+        atomic_write(self.log_path, lambda log_file: None)
+        self._load(exclusive=True)
+
+    def close(self):
+        for open_file in (self.log_file, self.index, self.lock_file):
+            if open_file is not None:
+                open_file.close()
+        self.index = self.log_file = self.lock_file = None
+        self.log_identity = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
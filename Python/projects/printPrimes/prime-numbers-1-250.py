@@ -1,26 +1,336 @@
+import argparse
+import array
+import bisect
+import concurrent.futures
+import functools
+import itertools
+import math
+import mmap
+import os
+import struct
+import sys
+
+# Primes below this limit are sieved once when the script starts. The table
+# answers is_prime() directly for small numbers and provides the trial
+# divisors for larger ones (it covers every divisor needed up to 2**32).
+SMALL_PRIME_LIMIT = 1 << 16
+
+# numbers sieved per segment; each segment needs one byte per odd number
+DEFAULT_SEGMENT_SIZE = 1 << 20
+
+# Miller-Rabin with these bases gives the exact answer for every number below
+# MILLER_RABIN_LIMIT, which covers all 64-bit numbers.
+MILLER_RABIN_BASES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37)
+MILLER_RABIN_LIMIT = 318665857834031151167461
+
+# number of recent is_prime() answers kept in memory
+IS_PRIME_CACHE_SIZE = 1 << 16
+
+# size of the write buffer used for the output file
+WRITE_BUFFER_SIZE = 1 << 20
+
+# Binary output: a 16 byte header (magic + prime count as a little-endian
+# uint64) followed by every prime as a little-endian uint32. The file can be
+# memory-mapped and the nth prime read straight from its offset.
+BINARY_MAGIC = b"PRIMEU32"
+BINARY_HEADER = struct.Struct("<8sQ")
+
+
+def simple_sieve(limit):
+    """
+    Sieve of Eratosthenes. Returns a bytearray where flags[n] is 1 if n is prime (0 <= n < limit).
+    """
+    flags = bytearray([1]) * limit
+    flags[:2] = b"\x00\x00"[:limit]
+    for p in range(2, math.isqrt(limit - 1) + 1):
+        if flags[p]:
+            # cross out every multiple of p starting from p*p in one slice assignment
+            flags[p * p::p] = bytes(len(range(p * p, limit, p)))
+    return flags
+
+
+SMALL_PRIME_FLAGS = simple_sieve(SMALL_PRIME_LIMIT)
+SMALL_PRIMES = list(itertools.compress(range(SMALL_PRIME_LIMIT), SMALL_PRIME_FLAGS))
+
+
+def miller_rabin(n):
+    """
+    Deterministic Miller-Rabin test for odd n below MILLER_RABIN_LIMIT (n > 37).
+    """
+    # write n - 1 as d * 2**s with d odd
+    d = n - 1
+    s = 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+    for a in MILLER_RABIN_BASES:
+        x = pow(a, d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for _ in range(s - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False  # a is a witness that n is composite
+    return True
+
+
+def trial_division(n):
+    """
+    Check an odd n >= SMALL_PRIME_LIMIT by dividing it by every candidate up to its square root.
+    """
+    # Try the precomputed primes up to the square root of n as divisors
+    root = math.isqrt(n)
+    for p in SMALL_PRIMES:
+        if p > root:
+            return True
+        if n % p == 0:
+            return False  # If divisible, it's not prime
+
+    # Beyond the table, check the remaining odd numbers up to the square root of n
+    for i in range(SMALL_PRIME_LIMIT + 1, root + 1, 2):
+        if n % i == 0:
+            return False
+    return True  # If no divisors found, it's prime
+
+
+@functools.lru_cache(maxsize=IS_PRIME_CACHE_SIZE)
 def is_prime(n):
     """
     Check if a number is prime.
     """
     if n <= 1:
         return False  # Numbers less than or equal to 1 are not prime
-    if n == 2:
-        return True  # 2 is the only even prime number
-    if n % 2 == 0:
-        return False  # Other even numbers are not prime
+    if n < SMALL_PRIME_LIMIT:
+        return SMALL_PRIME_FLAGS[n] == 1  # Small numbers are looked up in the precomputed table
 
-    # Check for factors from 3 to the square root of n (only odd numbers)
-    for i in range(3, int(n**0.5) + 1, 2):
-        if n % i == 0:
-            return False  # If divisible, it's not prime
-    return True  # If no divisors found, it's prime
+    # Most composite numbers have a small factor, which is cheaper to find than running Miller-Rabin
+    for p in SMALL_PRIMES[:25]:  # the primes below 100
+        if n % p == 0:
+            return False
+    if n < MILLER_RABIN_LIMIT:
+        return miller_rabin(n)  # Exact for every 64-bit number
+    return trial_division(n)
+
+
+def check_primes(numbers, jobs=None):
+    """
+    Return a list telling for each of the numbers whether it is prime.
+
+    The numbers are split across jobs worker processes (default: one per CPU).
+    """
+    numbers = list(numbers)
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(numbers) < 2:
+        return [is_prime(n) for n in numbers]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        chunk_size = max(1, len(numbers) // (jobs * 4))
+        return list(executor.map(is_prime, numbers, chunksize=chunk_size))
+
+
+def sieve_segment(task):
+    """
+    Return the primes in [low, high) using the base primes up to sqrt(high).
+    task is (low, high, base_primes) so it can be sent to a worker process.
+    """
+    low, high, base_primes = task
+    primes = [2] if low <= 2 < high else []
+    # only odd numbers are sieved: flags[i] stands for first_odd + 2*i
+    first_odd = max(low, 3) | 1
+    if first_odd >= high:
+        return primes
+    flags = bytearray([1]) * len(range(first_odd, high, 2))
+    for p in base_primes[1:]:
+        if p * p >= high:
+            break
+        # first odd multiple of p inside the segment, never below p*p
+        start = max(p * p, (first_odd + p - 1) // p * p)
+        if start % 2 == 0:
+            start += p
+        flags[(start - first_odd) // 2::p] = bytes(len(range(start, high, 2 * p)))
+    primes.extend(itertools.compress(range(first_odd, high, 2), flags))
+    return primes
+
+
+def iter_prime_segments(start, end, segment_size=DEFAULT_SEGMENT_SIZE, jobs=1):
+    """
+    Yield lists of the primes between start and end (inclusive), one list per segment, in order.
+
+    Only a few segments are held in memory at once. With jobs > 1 the segments
+    are sieved in parallel by a pool of worker processes.
+    """
+    start = max(start, 0)
+    if end < start:
+        return
+    base_primes = tuple(itertools.compress(range(math.isqrt(end) + 1), simple_sieve(math.isqrt(end) + 1)))
+    tasks = ((low, min(low + segment_size, end + 1), base_primes)
+             for low in range(start, end + 1, segment_size))
+    if jobs <= 1:
+        yield from map(sieve_segment, tasks)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        # keep at most two segments per worker in flight so memory stays bounded
+        pending = [executor.submit(sieve_segment, task) for task in itertools.islice(tasks, jobs * 2)]
+        while pending:
+            segment = pending.pop(0).result()
+            pending.extend(executor.submit(sieve_segment, task) for task in itertools.islice(tasks, 1))
+            yield segment
+
+
+class TextPrimeWriter:
+    """
+    Writes primes as space separated text, one joined string per segment
+    instead of one write() call per prime.
+    """
+
+    def __init__(self, path, start, end):
+        self.file = open(path, "w", buffering=WRITE_BUFFER_SIZE)
+        self.file.write(f"Prime numbers between {start}-{end}: \n")
+
+    def write(self, primes):
+        if primes:
+            self.file.write(" ".join(map(str, primes)) + " ")
+
+    def close(self):
+        self.file.close()
+
+
+class BinaryPrimeWriter:
+    """
+    Writes primes as a packed uint32 array that PrimeTable can memory-map.
+    """
+
+    def __init__(self, path, start, end):
+        if end >= 1 << 32:
+            raise ValueError("the binary format only holds primes below 2**32")
+        self.file = open(path, "wb", buffering=WRITE_BUFFER_SIZE)
+        self.count = 0
+        self.file.write(BINARY_HEADER.pack(BINARY_MAGIC, 0))
+
+    def write(self, primes):
+        packed = array.array("I", primes)
+        if sys.byteorder == "big":
+            packed.byteswap()
+        self.file.write(packed.tobytes())
+        self.count += len(primes)
+
+    def close(self):
+        # the prime count is only known at the end, so the header is rewritten
+        self.file.seek(0)
+        self.file.write(BINARY_HEADER.pack(BINARY_MAGIC, self.count))
+        self.file.close()
+
+
+class PrimeTable:
+    """
+    Read-only, memory-mapped view of a file written by BinaryPrimeWriter.
+
+    table[i] is the (i+1)th prime in the file, read in O(1) without loading
+    the file; `n in table` is a binary search.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = BINARY_HEADER.unpack_from(self.mmap) if len(self.mmap) >= BINARY_HEADER.size else (None, 0)
+        if magic != BINARY_MAGIC:
+            self.mmap.close()
+            raise ValueError(f"{path} is not a binary prime file")
+        if sys.byteorder == "little":
+            self.primes = memoryview(self.mmap)[BINARY_HEADER.size:].cast("I")
+        else:
+            self.primes = None
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("prime index out of range")
+        if self.primes is not None:
+            return self.primes[index]
+        return struct.unpack_from("<I", self.mmap, BINARY_HEADER.size + 4 * index)[0]
+
+    def nth_prime(self, n):
+        """
+        Return the nth prime stored in the file (n starts at 1).
+        """
+        if n < 1:
+            raise IndexError("n must be 1 or more")
+        return self[n - 1]
+
+    def __contains__(self, n):
+        index = bisect.bisect_left(self, n)
+        return index < self.count and self[index] == n
+
+    def close(self):
+        if self.primes is not None:
+            self.primes.release()
+        self.mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write the prime numbers in a range to a file.")
+    parser.add_argument("--start", type=int, default=1, help="first number to check (default: 1)")
+    parser.add_argument("--end", type=int, default=250, help="last number to check (default: 250)")
+    parser.add_argument("--format", choices=("text", "binary"), default="text",
+                        help="output format (default: text)")
+    parser.add_argument("--output", default=None,
+                        help="output file (default: printPrimes/prime-numbers.txt, or .bin for --format binary)")
+    parser.add_argument("--no-echo", action="store_true", help="do not print the primes to the console")
+    parser.add_argument("--segment-size", type=int, default=DEFAULT_SEGMENT_SIZE,
+                        help=f"numbers sieved per segment (default: {DEFAULT_SEGMENT_SIZE})")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help=f"worker processes for sieving (default: 1, this machine has {os.cpu_count()})")
+    parser.add_argument("--check", type=int, nargs="+", metavar="N",
+                        help="only check whether the given numbers are prime (uses --jobs worker processes)")
+    parser.add_argument("--nth", type=int, default=None,
+                        help="print the nth prime stored in a binary --output file instead of sieving")
+    args = parser.parse_args(argv)
+    if args.segment_size < 1:
+        parser.error("--segment-size must be positive")
+    if args.output is None:
+        extension = "bin" if args.format == "binary" or args.nth is not None else "txt"
+        args.output = f"printPrimes/prime-numbers.{extension}"
+
+    if args.check:
+        for n, prime in zip(args.check, check_primes(args.check, args.jobs)):
+            print(f"{n} is {'prime' if prime else 'not prime'}")
+        return
+
+    if args.nth is not None:
+        try:
+            with PrimeTable(args.output) as table:
+                print(table.nth_prime(args.nth))
+        except (IndexError, OSError, ValueError) as error:
+            parser.error(str(error))
+        return
+
+    writer_class = BinaryPrimeWriter if args.format == "binary" else TextPrimeWriter
+    try:
+        writer = writer_class(args.output, args.start, args.end)
+    except ValueError as error:
+        parser.error(str(error))
+    try:
+        for segment in iter_prime_segments(args.start, args.end, args.segment_size, args.jobs):
+            writer.write(segment)
+            if not args.no_echo and segment:
+                print(" ".join(map(str, segment)), end=" ")
+    finally:
+        writer.close()
 
+    print(f"\n Prime numbers have been written to '{os.path.basename(args.output)}'.")
 
-with open("printPrimes/prime-numbers.txt", "w") as file:
-    file.write("Prime numbers between 1-250: \n")
-    for x in range(1, 251):  # Loop through numbers 1 to 250
-        if is_prime(x):  # Check if the number is prime
-            file.write(f"{x} ")  # Write the prime number to the file
-            print(x, end=" ")
 
-print("\n Prime numbers have been written to 'prime-numbers.txt'.")
+if __name__ == "__main__":
+    main()
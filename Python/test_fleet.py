@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+
+import fleet
+
+# Run from this directory: python -m unittest test_fleet
+
+
+def fleetRow(number):
+    # every row has the same length, so byte ranges can be cut on line starts
+    return f"V{number:06d}, Make{number % 3}, Model{number % 2}, {2000 + number % 20}, {100 + number % 900:03d}, 150, 3.5, {number:06d}\n"
+
+
+class FleetFileTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "fleet.csv")
+
+    def writeFleet(self, lines):
+        with open(self.path, "w", encoding="utf-8") as fleetFile:
+            fleetFile.write(", ".join(fleet.fieldNames) + "\n")
+            fleetFile.writelines(lines)
+
+
+class ExtendTextTest(unittest.TestCase):
+    def testMisalignedRowsAreRejected(self):
+        # 9 fields and then 7: the total is right but the columns would shift
+        fleetColumns = fleet.FleetColumns()
+        with self.assertRaisesRegex(ValueError, "line 2: expected 8 fields, found 9"):
+            fleetColumns.extendText("V1, M, Mo, 2012, 1, 2, 3.0, 4, 99\nV2, M, 2013, 1, 2, 3.0, 4\n")
+        self.assertEqual(len(fleetColumns), 0)
+
+    def testPlainRows(self):
+        fleetColumns = fleet.FleetColumns()
+        fleetColumns.extendText(fleetRow(1) + fleetRow(2))
+        self.assertEqual([vehicle.vin for vehicle in fleetColumns], ["V000001", "V000002"])
+        self.assertEqual(fleetColumns[1].mileage, 2)
+
+
+class AggregateTest(FleetFileTest):
+    def summary(self, groups):
+        return {key: {field: (stats.count, stats.total, stats.minimum, stats.maximum)
+                      for field, stats in fieldStats.items()}
+                for key, fieldStats in groups.items()}
+
+    def testRangeEndingOnLineStart(self):
+        rows = [fleetRow(number) for number in range(40)]
+        self.writeFleet(rows)
+        headerEnd = len(", ".join(fleet.fieldNames)) + 1
+        end = headerEnd + 20 * len(rows[0])
+        first = fleet.aggregateRange((self.path, headerEnd, end, headerEnd, ("make",), ("year",)))
+        second = fleet.aggregateRange((self.path, end, os.path.getsize(self.path), headerEnd, ("make",), ("year",)))
+        self.assertEqual(sum(stats["year"].count for stats in first.values()), 20)
+        self.assertEqual(sum(stats["year"].count for stats in second.values()), 20)
+
+    def testJobsMatchSingleProcess(self):
+        rows = [fleetRow(number) for number in range(400)]
+        self.writeFleet(rows)
+        savedChunkBytes = fleet.chunkBytes
+        # ranges of exactly 10 rows, so every boundary is the start of a line
+        fleet.chunkBytes = 10 * len(rows[0])
+        try:
+            parallel = fleet.aggregateFleet(self.path, ("make", "year"), jobs=4)
+        finally:
+            fleet.chunkBytes = savedChunkBytes
+        single = fleet.aggregateFleet(self.path, ("make", "year"), jobs=1)
+        self.assertEqual(self.summary(parallel), self.summary(single))
+        self.assertEqual(sum(stats["mileage"].count for stats in single.values()), 400)
+
+
+if __name__ == "__main__":
+    unittest.main()